@@ -0,0 +1,104 @@
+"""
+Benchmark: leaderboard query on the old user_stats table vs guild_stats with its covering index,
+plus how long the online migration holds the writer per batch.
+Run from the repository root: python benchmarks/leaderboard_index_benchmark.py [rows] [guilds]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import stats_db
+from utils.stats_db import StatsDB, GUILD_STATS_SCHEMA, RANK_INDEX
+
+OLD_LEADERBOARD_SQL = 'SELECT user_id, level, xp FROM user_stats WHERE guild_id = ? ORDER BY level DESC, xp DESC LIMIT 10'
+NEW_LEADERBOARD_SQL = 'SELECT user_id, level, xp FROM guild_stats WHERE guild_id = ? ORDER BY xp DESC LIMIT 10'
+
+def build_legacy(path, rows, guilds):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('''
+        CREATE TABLE user_stats (
+            user_id INTEGER PRIMARY KEY, guild_id INTEGER, total_time INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1, xp INTEGER DEFAULT 0, songs_played INTEGER DEFAULT 0
+        )
+    ''')
+    def generate():
+        for user_id in range(1, rows + 1):
+            xp = random.randrange(200000)
+            yield user_id, random.randrange(guilds), random.randrange(360000), 1 + xp // 600, xp, random.randrange(500)
+    db.executemany('INSERT INTO user_stats VALUES (?, ?, ?, ?, ?, ?)', generate())
+    db.commit()
+    db.close()
+
+def plan(db, sql):
+    return ' / '.join(row[-1] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, (0,)))
+
+def time_query(db, sql, guilds, number=200):
+    guild_ids = [random.randrange(guilds) for _ in range(number)]
+    start = time.perf_counter()
+    for guild_id in guild_ids:
+        db.execute(sql, (guild_id,)).fetchall()
+    return (time.perf_counter() - start) / number * 1000
+
+async def migrate(path):
+    """Runs the online migration and returns (seconds, longest batch in ms)."""
+    db = StatsDB(path)
+    await db.open()
+    await db.create_schema()
+    longest = 0.0
+    migrate_batch = db._migrate_batch
+
+    async def timed_batch(batch):
+        # Each batch holds the writer for its whole duration
+        nonlocal longest
+        batch_start = time.perf_counter()
+        await migrate_batch(batch)
+        longest = max(longest, time.perf_counter() - batch_start)
+
+    db._migrate_batch = timed_batch
+    start = time.perf_counter()
+    try:
+        await db.migrate_legacy()
+    finally:
+        await db.close()
+    return time.perf_counter() - start, longest * 1000
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    guilds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'leveling.db')
+        print(f"Building user_stats with {rows} rows across {guilds} guilds...")
+        build_legacy(path, rows, guilds)
+
+        db = sqlite3.connect(path)
+        old_plan = plan(db, OLD_LEADERBOARD_SQL)
+        old_ms = time_query(db, OLD_LEADERBOARD_SQL, guilds, number=20)
+        db.close()
+
+        seconds, longest_batch = asyncio.run(migrate(path))
+        print(f"Online migration: {seconds:.1f}s total, longest batch {longest_batch:.1f}ms "
+              f"({stats_db.MIGRATION_BATCH} rows per batch)")
+
+        db = sqlite3.connect(path)
+        # Same statements cog_load runs; no-ops here, listed so the plan below is reproducible
+        db.execute(GUILD_STATS_SCHEMA)
+        db.execute(RANK_INDEX)
+        new_plan = plan(db, NEW_LEADERBOARD_SQL)
+        new_ms = time_query(db, NEW_LEADERBOARD_SQL, guilds)
+        db.close()
+
+    print(f"\nold: {old_plan}\n     {old_ms:.2f} ms per leaderboard")
+    print(f"new: {new_plan}\n     {new_ms:.3f} ms per leaderboard")
+    assert 'COVERING INDEX idx_guild_stats_rank' in new_plan, new_plan
+    assert 'TEMP B-TREE' not in new_plan, new_plan
+
+if __name__ == "__main__":
+    main()
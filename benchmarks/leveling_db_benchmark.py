@@ -0,0 +1,73 @@
+"""
+Benchmark: a new aiosqlite connection per command vs the shared StatsDB connections.
+Each "command" is one stats lookup (!level / !profile); every tenth also writes a row,
+like the old per-message XP update did.
+Run from the repository root: python benchmarks/leveling_db_benchmark.py [commands] [users]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite
+
+from utils.stats_db import StatsDB
+
+SELECT_SQL = 'SELECT total_time, xp, songs_played FROM user_stats WHERE user_id = ?'
+UPDATE_SQL = 'UPDATE user_stats SET xp = xp + ? WHERE user_id = ?'
+
+async def create(path, users):
+    async with aiosqlite.connect(path) as db:
+        await db.execute('PRAGMA journal_mode=WAL')
+        await db.execute('''
+            CREATE TABLE user_stats (
+                user_id INTEGER PRIMARY KEY, guild_id INTEGER, total_time INTEGER DEFAULT 0,
+                level INTEGER DEFAULT 1, xp INTEGER DEFAULT 0, songs_played INTEGER DEFAULT 0
+            )
+        ''')
+        await db.executemany('INSERT INTO user_stats VALUES (?, 1, ?, 1, ?, 0)',
+                             [(i, random.randrange(100000), random.randrange(50000)) for i in range(users)])
+        await db.commit()
+
+async def connect_per_command(path, user_ids):
+    for i, user_id in enumerate(user_ids):
+        async with aiosqlite.connect(path) as db:
+            cursor = await db.execute(SELECT_SQL, (user_id,))
+            await cursor.fetchone()
+            if i % 10 == 0:
+                await db.execute(UPDATE_SQL, (20, user_id))
+                await db.commit()
+
+async def shared_connections(path, user_ids):
+    db = StatsDB(path)
+    await db.open()
+    await db.open_reader()
+    try:
+        for i, user_id in enumerate(user_ids):
+            await db.fetchone(SELECT_SQL, (user_id,))
+            if i % 10 == 0:
+                await db.write_many(UPDATE_SQL, [(20, user_id)])
+    finally:
+        await db.close()
+
+async def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    user_ids = [random.randrange(users) for _ in range(commands)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'leveling.db')
+        await create(path, users)
+        print(f"{commands} commands against {users} users (higher is better)")
+        for name, run in (("connect per command", connect_per_command), ("shared StatsDB", shared_connections)):
+            start = time.perf_counter()
+            await run(path, user_ids)
+            seconds = time.perf_counter() - start
+            print(f"{name:<22}{commands / seconds:>10.0f} commands/s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
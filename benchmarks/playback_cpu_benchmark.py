@@ -0,0 +1,86 @@
+"""
+CPU cost per stream: PCM path (discord.py volume scaling + Opus encode in Python)
+vs Opus path (ffmpeg encodes with a volume filter, or copies an Opus source).
+Needs ffmpeg on PATH; the PCM path also needs discord.py with libopus loaded.
+Run from the repository root: python benchmarks/playback_cpu_benchmark.py [seconds]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import warnings
+
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+import audioop
+
+FRAME_BYTES = 3840 # 20 ms of 48 kHz stereo s16le, what discord.py reads per packet
+VOLUME = 0.5
+
+def make_source(path, seconds):
+    # webm/opus like YouTube's bestaudio
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}",
+        '-ac', '2', '-ar', '48000', '-c:a', 'libopus', '-b:a', '128k', path,
+    ], check=True)
+
+def cpu_now():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def run(cmd, per_frame=None, frame_bytes=FRAME_BYTES):
+    start = cpu_now()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    while True:
+        chunk = proc.stdout.read(frame_bytes)
+        if not chunk:
+            break
+        if per_frame:
+            per_frame(chunk)
+    proc.wait()
+    return cpu_now() - start
+
+def pcm_path(path):
+    try:
+        from discord import opus
+        encoder = opus.Encoder() if opus.is_loaded() or opus._load_default() else None
+    except Exception:
+        encoder = None
+
+    def per_frame(frame):
+        # PCMVolumeTransformer.read() + AudioPlayer encoding
+        frame = audioop.mul(frame, 2, VOLUME)
+        if encoder and len(frame) == FRAME_BYTES:
+            encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+
+    cmd = ['ffmpeg', '-loglevel', 'error', '-i', path, '-f', 's16le', '-ar', '48000', '-ac', '2', 'pipe:1']
+    return run(cmd, per_frame), encoder is not None
+
+def opus_filter_path(path):
+    cmd = ['ffmpeg', '-loglevel', 'error', '-i', path, '-af', f"volume={VOLUME}", '-f', 'opus', '-c:a', 'libopus', '-ar', '48000', '-ac', '2', '-b:a', '128k', 'pipe:1']
+    return run(cmd, frame_bytes=65536)
+
+def opus_copy_path(path):
+    cmd = ['ffmpeg', '-loglevel', 'error', '-i', path, '-f', 'opus', '-c:a', 'copy', 'pipe:1']
+    return run(cmd, frame_bytes=65536)
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'source.webm')
+        make_source(path, seconds)
+
+        pcm_cpu, encoded = pcm_path(path)
+        results = [
+            ("pcm + python volume" + (" + opus encode" if encoded else " (libopus missing, encode not counted)"), pcm_cpu),
+            ("opus, ffmpeg volume filter", opus_filter_path(path)),
+            ("opus, stream copy (volume 100%)", opus_copy_path(path)),
+        ]
+
+    print(f"CPU seconds per minute of audio ({seconds}s source, decoded as fast as possible)")
+    for name, cpu in results:
+        print(f"{name:<60}{cpu / seconds * 60:8.3f}")
+
+if __name__ == "__main__":
+    main()
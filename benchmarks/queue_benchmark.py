@@ -0,0 +1,49 @@
+"""
+Micro-benchmark: plain list vs TrackQueue for the queue operations the Music cog uses.
+Run from the repository root: python benchmarks/queue_benchmark.py [entries]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.track_queue import TrackQueue
+
+def make_entries(n):
+    return [{'url': f"https://www.youtube.com/watch?v={i:011d}", 'title': f"Song {i}", 'requester_id': 1} for i in range(n)]
+
+def bench(make, op, number):
+    # A fresh queue per repeat so popping operations never run dry
+    seconds = min(timeit.repeat(op, setup=make, number=number, repeat=5, globals=None))
+    return seconds / number * 1e6
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    entries = make_entries(n)
+    positions = [random.randrange(n // 2) for _ in range(1000)]
+    state = {}
+
+    def list_setup():
+        state['q'] = list(entries)
+    def queue_setup():
+        state['q'] = TrackQueue(entries)
+
+    cases = [
+        ("pop head", lambda: state['q'].pop(0), lambda: state['q'].popleft()),
+        ("index middle", lambda: state['q'][n // 2], lambda: state['q'][n // 2]),
+        ("remove at i", lambda: state['q'].pop(positions[len(state['q']) % 1000]), lambda: state['q'].pop(positions[len(state['q']) % 1000])),
+        ("skip to i (move to top)", lambda: state['q'].insert(0, state['q'].pop(positions[0])), lambda: state['q'].move(positions[0], 0)),
+        ("page 10 entries at n/2", lambda: state['q'][n // 2:n // 2 + 10], lambda: list(state['q'].islice(n // 2, n // 2 + 10))),
+    ]
+
+    print(f"{n} queued entries, microseconds per operation (lower is better)")
+    print(f"{'operation':<26}{'list':>10}{'TrackQueue':>12}")
+    for name, list_op, queue_op in cases:
+        list_us = bench(list_setup, list_op, 1000)
+        queue_us = bench(queue_setup, queue_op, 1000)
+        print(f"{name:<26}{list_us:>10.2f}{queue_us:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Memory benchmark: queue entries as dicts (old) vs Track records.
+Run from the repository root: python benchmarks/track_memory_benchmark.py [tracks]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.track import Track
+
+REQUESTERS = 50
+
+def fake_info(i):
+    # Like a flat playlist entry from yt-dlp; IDs and titles are fresh objects per entry
+    return {
+        'url': f"https://www.youtube.com/watch?v={i:011d}",
+        'title': f"Artist {i % 997} - Song {i}",
+        'duration': 180 + i % 120,
+        'ie_key': 'Youtube',
+    }
+
+def requester(i):
+    # Parsed from text like discord.py does, so equal IDs are separate int objects
+    return int(str(100000000000000000 + i % REQUESTERS))
+
+def as_dicts(n):
+    entries = []
+    for i in range(n):
+        info = fake_info(i)
+        entry = {
+            'url': info.get('original_url') or info.get('webpage_url') or info.get('url'),
+            'title': info.get('title', 'Unknown Title'),
+            'requester_id': requester(i),
+        }
+        # play_next used to enrich entries in place
+        entry['duration'] = info['duration']
+        entry['thumbnail'] = None
+        entries.append(entry)
+    return entries
+
+def as_tracks(n):
+    return [Track.from_info(fake_info(i), requester(i)) for i in range(n)]
+
+def measure(build, n):
+    tracemalloc.start()
+    entries = build(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return current
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    before = measure(as_dicts, n)
+    after = measure(as_tracks, n)
+    print(f"{n} queued tracks")
+    print(f"dict entries:  {before / 1024 / 1024:8.1f} MB ({before / n:.0f} B/track)")
+    print(f"Track records: {after / 1024 / 1024:8.1f} MB ({after / n:.0f} B/track)")
+    print(f"saved:         {(before - after) / 1024 / 1024:8.1f} MB ({(1 - after / before) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -75,17 +75,23 @@ class General(commands.Cog):
             "`!skip (s) [index]` - Lewati lagu (opsional: ke urutan tertentu)\n"
             "`!stop (st)` - Stop & bersihkan queue\n"
             "`!queue (q)` - Lihat antrian\n"
+            "`!remove (rm) <no>` - Hapus lagu dari antrian\n"
+            "`!move (mv) <dari> <ke>` - Pindah posisi lagu\n"
+            "`!shuffle (sh)` - Acak antrian\n"
             "`!loop (lp)` - Mode Loop\n"
             "`!volume (v, vol)` - Atur volume (0-100)\n"
+            "`!seek <waktu>` - Lompat ke posisi lagu (mis. 1:30)\n"
+            "`!filter (fx) <nama>` - Efek audio: bassboost, nightcore, speed, off\n"
+            "`!forget (badmatch) <judul/link>` - Hapus hasil pencarian yang salah\n"
             "`!join (j)` / `!leave (l)`"
         )
         embed.add_field(name="🎵 Music", value=music_cmds, inline=False)
         
         # Leveling
         level_cmds = (
-            "`!level (lvl)` - Cek level & XP\n"
+            "`!level (lvl)` - Cek level, XP & peringkat\n"
             "`!xyzprofile (pf)` - Lihat profil\n"
-            "`!leaderboard (lb, top)` - Top 10 users"
+            "`!leaderboard (lb, top) [halaman]` - Papan peringkat, 10 per halaman"
         )
         embed.add_field(name="📊 Leveling", value=level_cmds, inline=False)
         
@@ -1,25 +1,69 @@
 import discord
 from discord.ext import commands, tasks
-import aiosqlite
+import asyncio
 import time
 import os
 import random
 
+from utils.leaderboard import GuildLeaderboard, LeaderboardCache
+from utils.stats_db import StatsDB
+
 # Constants
 VOICE_XP_PER_TICK = 1  # 5 seconds = 1 XP => 12 XP/min
 VOICE_TIME_PER_TICK = 5 # 5 seconds
 CHAT_XP_RANGE = (15, 25)
 CHAT_COOLDOWN = 60
+LEADERBOARD_PAGE_SIZE = 10
 XP_PER_LEVEL = 600
+XP_FLUSH_INTERVAL = int(os.getenv('XP_FLUSH_INTERVAL', 30)) # Seconds between writes of buffered XP
+
+# One statement per flush: new users are inserted, existing ones get the deltas added
+# and their level recomputed by SQLite from the new XP total
+UPSERT_STATS_SQL = f'''
+    INSERT INTO guild_stats (guild_id, user_id, total_time, xp, level, songs_played)
+    VALUES (?, ?, ?, ?, 1 + ? / {XP_PER_LEVEL}, ?)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+        total_time = total_time + excluded.total_time,
+        xp = xp + excluded.xp,
+        level = 1 + (xp + excluded.xp) / {XP_PER_LEVEL},
+        songs_played = songs_played + excluded.songs_played
+'''
+SELECT_STATS_SQL = 'SELECT total_time, xp, songs_played FROM guild_stats WHERE guild_id = ? AND user_id = ?'
+# Everyone's XP in a guild, read straight from idx_guild_stats_rank to build the in-memory leaderboard
+LEADERBOARD_SQL = 'SELECT user_id, xp FROM guild_stats WHERE guild_id = ?'
+# Old single-guild rows not migrated yet (only while StatsDB.migrate_legacy runs), with its xp backfill applied
+LEGACY_XP = 'CASE WHEN xp = 0 AND total_time > 0 THEN (total_time / 60) * 10 ELSE xp END'
+LEGACY_STATS_SQL = f'SELECT total_time, {LEGACY_XP}, songs_played FROM user_stats WHERE user_id = ? AND guild_id = ? AND user_id > ?'
+LEGACY_LEADERBOARD_SQL = f'SELECT user_id, {LEGACY_XP} FROM user_stats WHERE guild_id = ? AND user_id > ?'
 
 class Leveling(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.chat_cooldowns = {} # {member_id: last_message_timestamp}
-        self.voice_xp_loop.start()
+        # Write-behind buffers: {(guild_id, user_id): [voice seconds, xp, songs played]}
+        self.pending = {} # Collecting since the last flush
+        self.flushing = {} # Being written right now
+        self.flush_task = None
+        self.migration_task = None
+        self.db = None
+        self.leaderboards = LeaderboardCache()
+        # Members earning voice XP: {(guild_id, user_id): [start (monotonic), whole seconds credited]}
+        self.voice_sessions = {}
+        self.flush_loop.start()
 
-    def cog_unload(self):
-        self.voice_xp_loop.cancel()
+    async def cog_unload(self):
+        self.flush_loop.cancel()
+        if self.migration_task:
+            # Let the running batch commit with its progress row; it resumes from there next start
+            self.db.stop_migration()
+            try:
+                await self.migration_task
+            except Exception:
+                pass # Already reported by migration_done; still flush and close below
+        self.checkpoint_voice()
+        await self.flush_xp()
+        if self.db:
+            await self.db.close()
 
     async def cog_load(self):
         # Ensure data directory exists
@@ -27,117 +71,207 @@ class Leveling(commands.Cog):
         os.makedirs(self.data_dir, exist_ok=True)
         self.db_path = os.path.join(self.data_dir, 'leveling.db')
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    guild_id INTEGER,
-                    total_time INTEGER DEFAULT 0,
-                    level INTEGER DEFAULT 1,
-                    xp INTEGER DEFAULT 0,
-                    songs_played INTEGER DEFAULT 0
-                )
-            ''')
-            try:
-                await db.execute('ALTER TABLE user_stats ADD COLUMN songs_played INTEGER DEFAULT 0')
-            except Exception:
-                pass 
-            
-            # Backfill migration (kept for safety if not run yet)
-            await db.execute('''
-                UPDATE user_stats 
-                SET xp = (total_time / 60) * 10 
-                WHERE xp = 0 AND total_time > 0
-            ''')
-            await db.commit()
+        # Shared for the cog's lifetime instead of a connection per command
+        self.db = StatsDB(self.db_path, XP_PER_LEVEL)
+        await self.db.open()
+        await self.db.create_schema()
+        await self.db.open_reader()
+        if self.db.migrated_upto is not None:
+            # Databases from before per-guild stats: move rows over in small batches while the bot runs
+            print("Leveling: migrating user_stats to per-guild stats in the background")
+            self.migration_task = asyncio.create_task(self.db.migrate_legacy())
+            self.migration_task.add_done_callback(self.migration_done)
         print("Leveling Database Initialized")
+        if self.bot.is_ready():
+            # Reloaded while connected; on_ready won't fire again
+            self.reconcile_voice()
+
+    def migration_done(self, task):
+        if not task.cancelled() and task.exception():
+            # Progress up to the last committed batch is kept; the next start resumes from there
+            print(f"Leveling migration failed after {self.db.stats['migrated']} rows, will retry on next start: {task.exception()}")
 
     def calculate_level(self, xp):
         return 1 + int(xp / XP_PER_LEVEL)
 
-    async def add_xp(self, user_id, guild_id, amount, db):
-        cursor = await db.execute('SELECT xp, total_time, level FROM user_stats WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
+    def add_stats(self, user_id, guild_id, total_time=0, xp=0, songs_played=0):
+        """Buffers stat changes in memory; flush_xp writes them."""
+        self.buffer((guild_id, user_id), total_time, xp, songs_played)
+        board = self.leaderboards.peek(guild_id)
+        if board is not None:
+            board.add(user_id, xp)
 
-        if row:
-            current_xp, total_time, current_level = row
-            new_xp = current_xp + amount
-            new_level = self.calculate_level(new_xp)
-            await db.execute('UPDATE user_stats SET xp = ?, level = ? WHERE user_id = ?', (new_xp, new_level, user_id))
-            return new_level > current_level
-        else:
-            new_xp = amount
-            new_level = self.calculate_level(new_xp)
-            await db.execute('INSERT INTO user_stats (user_id, guild_id, total_time, level, xp, songs_played) VALUES (?, ?, 0, ?, ?, 0)', 
-                             (user_id, guild_id, new_level, new_xp))
-            return False
-
-    async def update_voice_stats_bulk(self, updates):
-        """
-        Updates updates: list of (user_id, guild_id)
-        Adds VOICE_TIME_PER_TICK seconds and VOICE_XP_PER_TICK XP to each.
-        """
-        if not updates:
+    def buffer(self, key, total_time, xp, songs_played):
+        """Adds to the pending deltas only; loaded leaderboards are left alone."""
+        delta = self.pending.get(key)
+        if delta is None:
+            delta = self.pending[key] = [0, 0, 0]
+        delta[0] += total_time
+        delta[1] += xp
+        delta[2] += songs_played
+
+    def unflushed(self, user_id, guild_id):
+        """Returns (voice seconds, xp, songs played) not written to the database yet."""
+        total_time = xp = songs_played = 0
+        for buffer in (self.flushing, self.pending):
+            delta = buffer.get((guild_id, user_id))
+            if delta:
+                total_time += delta[0]
+                xp += delta[1]
+                songs_played += delta[2]
+        return total_time, xp, songs_played
+
+    async def flush_xp(self):
+        """Writes all buffered stats with one batched UPSERT."""
+        while self.flush_task:
+            # Let the running flush finish, then write what came in meanwhile
+            await asyncio.shield(self.flush_task)
+        if not self.pending:
             return
+        self.flushing, self.pending = self.pending, {}
+        self.flush_task = asyncio.ensure_future(self._write_stats(self.flushing))
+        # shield: a cancelled caller (cog unload) must not abandon a half-done write
+        await asyncio.shield(self.flush_task)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            for user_id, guild_id in updates:
-                # 1. Get current stats
-                cursor = await db.execute('SELECT total_time, xp, level FROM user_stats WHERE user_id = ?', (user_id,))
-                row = await cursor.fetchone()
-                
-                if row:
-                    total_time, xp, level = row
-                    new_time = total_time + VOICE_TIME_PER_TICK
-                    new_xp = xp + VOICE_XP_PER_TICK
-                    new_level = self.calculate_level(new_xp)
-                    
-                    await db.execute('UPDATE user_stats SET total_time = ?, xp = ?, level = ? WHERE user_id = ?', 
-                                     (new_time, new_xp, new_level, user_id))
-                else:
-                    # Initialize
-                    new_xp = VOICE_XP_PER_TICK
-                    new_level = self.calculate_level(new_xp)
-                    await db.execute('INSERT INTO user_stats (user_id, guild_id, total_time, level, xp, songs_played) VALUES (?, ?, ?, ?, ?, 0)', 
-                                     (user_id, guild_id, VOICE_TIME_PER_TICK, new_level, new_xp))
-            
-            await db.commit()
+    async def _write_stats(self, batch):
+        rows = [(guild_id, user_id, total_time, xp, xp, songs_played)
+                for (guild_id, user_id), (total_time, xp, songs_played) in batch.items()]
+        try:
+            await self.db.write_many(UPSERT_STATS_SQL, rows)
+        except Exception as e:
+            print(f"XP flush failed, keeping {len(rows)} updates for the next one: {e}")
+            # Leaderboards already counted this XP when it was first added
+            for key, (total_time, xp, songs_played) in batch.items():
+                self.buffer(key, total_time, xp, songs_played)
+        finally:
+            self.flushing = {}
+            self.flush_task = None
+
+    async def get_stats(self, user_id, guild_id):
+        """Returns (total_time, level, xp, songs_played) in a guild including unflushed changes, or None for unknown users."""
+        self.credit_voice(user_id, guild_id)
+        rows = [await self.db.fetchone(SELECT_STATS_SQL, (guild_id, user_id))]
+        migrated_upto = self.db.migrated_upto
+        if migrated_upto is not None and user_id > migrated_upto:
+            rows.append(await self.db.fetchone(LEGACY_STATS_SQL, (user_id, guild_id, migrated_upto)))
+        rows.append(self.unflushed(user_id, guild_id))
+
+        rows = [row for row in rows if row and any(row)]
+        if not rows:
+            return None
+        total_time, xp, songs_played = (sum(column) for column in zip(*rows))
+        return total_time, self.calculate_level(xp), xp, songs_played
+
+    async def leaderboard_for(self, guild_id):
+        """Returns the guild's in-memory leaderboard, loading it on first use."""
+        board = self.leaderboards.get(guild_id)
+        if board is not None:
+            return board
+        # Holding the writer means no flush or migration batch commits while the rows are read,
+        # so database rows plus the write buffers count every XP change exactly once
+        async with self.db.write_lock:
+            board = self.leaderboards.get(guild_id)
+            if board is not None:
+                return board
+            totals = dict(await self.db.fetchall(LEADERBOARD_SQL, (guild_id,)))
+            migrated_upto = self.db.migrated_upto
+            if migrated_upto is not None:
+                for user_id, xp in await self.db.fetchall(LEGACY_LEADERBOARD_SQL, (guild_id, migrated_upto)):
+                    totals[user_id] = totals.get(user_id, 0) + xp
+            for buffer in (self.flushing, self.pending):
+                for (key_guild_id, user_id), (_, xp, _) in buffer.items():
+                    if key_guild_id == guild_id:
+                        totals[user_id] = totals.get(user_id, 0) + xp
+            # From here on add_stats keeps it up to date
+            board = GuildLeaderboard(totals)
+            self.leaderboards.put(guild_id, board)
+        return board
+
+    async def get_rank(self, user_id, guild_id):
+        """Returns (rank, members ranked) in a guild; rank is None for users without stats."""
+        self.credit_voice(user_id, guild_id)
+        board = await self.leaderboard_for(guild_id)
+        return board.rank(user_id), len(board)
 
     async def increment_songs_played(self, user_id, guild_id):
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT songs_played FROM user_stats WHERE user_id = ?', (user_id,))
-            row = await cursor.fetchone()
-            
-            if row:
-                songs_played = row[0] + 1
-                await db.execute('UPDATE user_stats SET songs_played = ? WHERE user_id = ?', (songs_played, user_id))
-            else:
-                await db.execute('INSERT INTO user_stats (user_id, guild_id, total_time, level, xp, songs_played) VALUES (?, ?, 0, 1, 0, 1)', (user_id, guild_id))
-            
-            await db.commit()
+        self.add_stats(user_id, guild_id, songs_played=1)
 
-    @tasks.loop(seconds=5)
-    async def voice_xp_loop(self):
-        updates = []
+    def earns_voice_xp(self, member, voice):
+        """Members in a voice channel earn XP unless they are a bot or deafened."""
+        return bool(voice and voice.channel) and not member.bot and not (voice.self_deaf or voice.deaf)
+
+    def start_voice_session(self, user_id, guild_id):
+        self.voice_sessions[(guild_id, user_id)] = [time.monotonic(), 0]
+
+    def credit_voice(self, user_id, guild_id, now=None):
+        """Buffers the voice time and XP a session earned since it was last credited."""
+        session = self.voice_sessions.get((guild_id, user_id))
+        if not session:
+            return
+        start, credited = session
+        seconds = int((now or time.monotonic()) - start)
+        if seconds <= credited:
+            return
+        # XP follows whole ticks of the session so the rate matches VOICE_XP_PER_TICK per VOICE_TIME_PER_TICK
+        xp = (seconds // VOICE_TIME_PER_TICK - credited // VOICE_TIME_PER_TICK) * VOICE_XP_PER_TICK
+        self.add_stats(user_id, guild_id, total_time=seconds - credited, xp=xp)
+        session[1] = seconds
+
+    def end_voice_session(self, user_id, guild_id):
+        self.credit_voice(user_id, guild_id)
+        self.voice_sessions.pop((guild_id, user_id), None)
+
+    def checkpoint_voice(self):
+        """Credits every open session, so the buffer holds voice time up to now."""
+        now = time.monotonic()
+        for guild_id, user_id in self.voice_sessions:
+            self.credit_voice(user_id, guild_id, now)
+
+    def reconcile_voice(self):
+        """Matches sessions to who is actually in voice, e.g. after startup or a reconnect."""
+        present = set()
         for guild in self.bot.guilds:
-            for channel in guild.voice_channels:
-                if len(channel.members) == 0:
-                    continue
+            # Stage channels count too, same as in on_voice_state_update
+            for channel in guild.voice_channels + guild.stage_channels:
                 for member in channel.members:
-                    if member.bot:
-                        continue
-                    if member.voice.self_deaf or member.voice.deaf:
-                        # Optional: Don't award XP if deafened?
-                        pass
-                    
-                    updates.append((member.id, guild.id))
-        
-        if updates:
-            await self.update_voice_stats_bulk(updates)
+                    if self.earns_voice_xp(member, member.voice):
+                        present.add((guild.id, member.id))
+        for guild_id, user_id in [key for key in self.voice_sessions if key not in present]:
+            # Left while we were not watching: credit up to now
+            self.end_voice_session(user_id, guild_id)
+        for guild_id, user_id in present:
+            if (guild_id, user_id) not in self.voice_sessions:
+                self.start_voice_session(user_id, guild_id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Also fires after reconnects, when voice events may have been missed
+        self.reconcile_voice()
 
-    @voice_xp_loop.before_loop
-    async def before_voice_loop(self):
-        await self.bot.wait_until_ready()
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.bot:
+            return
+        # Sessions are per guild: a hop to another server's voice may deliver the
+        # new guild's join before the old guild's leave, and each only touches its own
+        guild_id = member.guild.id
+        was_earning = (guild_id, member.id) in self.voice_sessions
+        earning = self.earns_voice_xp(member, after)
+        if was_earning and earning and before.channel == after.channel:
+            # Mute, stream or video toggles don't change anything
+            return
+        if was_earning:
+            # Left, moved or deafened
+            self.end_voice_session(member.id, guild_id)
+        if earning:
+            self.start_voice_session(member.id, guild_id)
+
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL)
+    async def flush_loop(self):
+        # Periodic checkpoint: long sessions show up without waiting for the member to leave
+        self.checkpoint_voice()
+        await self.flush_xp()
+        self.leaderboards.evict_idle()
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -154,20 +288,16 @@ class Leveling(commands.Cog):
         self.chat_cooldowns[user_id] = now
         
         choice_xp = random.randint(*CHAT_XP_RANGE)
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            await self.add_xp(user_id, message.guild.id, choice_xp, db)
-            await db.commit()
+        self.add_stats(user_id, message.guild.id, xp=choice_xp)
 
     @commands.command(name='level', aliases=['lvl', 'rank'])
     async def level(self, ctx, member: discord.Member = None):
         member = member or ctx.author
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT total_time, level, xp FROM user_stats WHERE user_id = ?', (member.id,))
-            row = await cursor.fetchone()
+        row = await self.get_stats(member.id, ctx.guild.id)
 
         if row:
-            total_time, level, xp = row
+            total_time, level, xp, _ = row
+            rank, ranked = await self.get_rank(member.id, ctx.guild.id)
             hours = total_time // 3600
             minutes = (total_time % 3600) // 60
             
@@ -175,6 +305,7 @@ class Leveling(commands.Cog):
             embed.set_thumbnail(url=member.display_avatar.url)
             embed.add_field(name="Level", value=str(level), inline=True)
             embed.add_field(name="XP", value=f"{xp}", inline=True)
+            embed.add_field(name="Rank", value=f"#{rank} of {ranked}" if rank else "-", inline=True)
             embed.add_field(name="Total Voice Time", value=f"{hours}h {minutes}m", inline=True)
             
             current_level_floor = (level - 1) * XP_PER_LEVEL
@@ -195,14 +326,13 @@ class Leveling(commands.Cog):
              await ctx.send(f"❌ {member.name} has no stats recorded yet.")
 
     async def generate_profile_embed(self, member):
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT total_time, level, xp, songs_played FROM user_stats WHERE user_id = ?', (member.id,))
-            row = await cursor.fetchone()
+        row = await self.get_stats(member.id, member.guild.id)
 
         if row:
             total_time, level, xp, songs_played = row
         else:
             total_time, level, xp, songs_played = 0, 1, 0, 0
+        rank, ranked = await self.get_rank(member.id, member.guild.id)
 
         hours = total_time // 3600
         minutes = (total_time % 3600) // 60
@@ -227,6 +357,7 @@ class Leveling(commands.Cog):
         embed.add_field(name="🎵 Songs Played", value=f"**{songs_played}**", inline=True)
         embed.add_field(name="🆙 Level", value=f"**{level}**", inline=True)
         embed.add_field(name="✨ XP", value=f"**{xp}**", inline=True)
+        embed.add_field(name="🏆 Rank", value=f"**#{rank}** of {ranked}" if rank else "**-**", inline=True)
         
         embed.add_field(name="XP Progress", value=f"`[{bar}]` **{percentage}%**\n`{xp}/{next_level_xp} XP`", inline=False)
         
@@ -241,32 +372,31 @@ class Leveling(commands.Cog):
         await ctx.send(embed=embed, view=view)
 
     @commands.command(name='leaderboard', aliases=['lb', 'top'])
-    async def leaderboard(self, ctx):
-        """Shows the top 10 users by level in the server."""
-        guild_id = ctx.guild.id
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                SELECT user_id, level, xp 
-                FROM user_stats 
-                WHERE guild_id = ? 
-                ORDER BY level DESC, xp DESC 
-                LIMIT 10
-            ''', (guild_id,))
-            rows = await cursor.fetchall()
-            
-        if not rows:
+    async def leaderboard(self, ctx, page: int = 1):
+        """Shows the server's users by XP, 10 per page."""
+        # Served from memory; open voice sessions are credited first so the ranking is current
+        self.checkpoint_voice()
+        board = await self.leaderboard_for(ctx.guild.id)
+        if not len(board):
             return await ctx.send("No stats recorded for this server yet.")
-            
+
+        pages = (len(board) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+        page = min(max(page, 1), pages)
+        start = (page - 1) * LEADERBOARD_PAGE_SIZE
+        rows = board.page(start, LEADERBOARD_PAGE_SIZE)
+
         embed = discord.Embed(title=f"🏆 {ctx.guild.name} Leaderboard", color=discord.Color.gold())
         
         description = ""
-        for i, row in enumerate(rows):
-            user_id, level, xp = row
+        for i, (user_id, xp) in enumerate(rows, start):
             rank_emoji = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else f"#{i+1}"
-            description += f"{rank_emoji} <@{user_id}> • Level {level} • {xp} XP\n"
+            description += f"{rank_emoji} <@{user_id}> • Level {self.calculate_level(xp)} • {xp} XP\n"
             
         embed.description = description
-        embed.set_footer(text="Keep chatting & talking to climb the ranks!")
+        footer = "Keep chatting & talking to climb the ranks!"
+        if pages > 1:
+            footer = f"Page {page}/{pages} • !lb <page> • {footer}"
+        embed.set_footer(text=footer)
         
         await ctx.send(embed=embed)
 
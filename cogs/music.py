@@ -1,14 +1,112 @@
 import discord
 from discord.ext import commands
-import yt_dlp
 import asyncio
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import time
 import datetime
+import re
+from utils.extraction_cache import ExtractionCache, canonical_key
+from utils.search_memo import SearchMemo, normalize_query
+from utils.spotify import SpotifyClient
+from utils.extractor import Extractor, SingleFlight, EXTRACTOR_WORKERS
+from utils.guild_player import GuildPlayer
+from utils.track import Track
+from utils.audio_cache import AudioCache, AUDIO_CACHE_ENABLED
+from utils.prebuffer import PrebufferedSource
+from utils.governor import Governor
+from utils.playlist_feed import PlaylistFeed, PLAYLIST_LOW_WATER, PLAYLIST_PAGE_RETRIES, PLAYLIST_PAGE_SIZE
+from utils.queue_store import QueueStore, QUEUE_SNAPSHOT_INTERVAL
 
-import datetime
+# Prefetch settings
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', 1)) # How many queued songs to resolve ahead
+
+# Playback settings
+PLAYBACK_MODE = os.getenv('PLAYBACK_MODE', 'opus') # 'opus': ffmpeg outputs Opus, 'pcm': discord.py encodes
+OPUS_BITRATE = 128 # kbps when ffmpeg has to encode
+
+# Gapless settings
+GAPLESS_ENABLED = os.getenv('GAPLESS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+GAPLESS_LEAD = 15 # Seconds before the end of a song to start the next one's ffmpeg
+PREBUFFER_SECONDS = 3 # Audio read ahead from the next song
+GAPLESS_BUFFER_KB = int(os.getenv('GAPLESS_BUFFER_KB', 1024)) # Hard cap on read-ahead per guild
+CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', 0)) # Fade out/in length at song boundaries (gapless mode)
+
+# Audio effects for !filter: name -> (ffmpeg filter chain, playback rate)
+# Nightcore resamples to a fixed rate first so the pitch shift is the same for 44.1 and 48 kHz sources.
+FILTERS = {
+    'bassboost': ('bass=g=8', 1.0),
+    'nightcore': ('aresample=48000,asetrate=60000,aresample=48000', 1.25),
+    'speed': ('atempo=1.25', 1.25),
+}
+
+# Spotify resolver settings
+RESOLVE_CONCURRENCY = int(os.getenv('RESOLVE_CONCURRENCY', 4)) # Parallel searches per playlist
+# Parallel background searches across all guilds. Kept below the extractor pool size so
+# a huge playlist always leaves workers free for other guilds' !play requests.
+RESOLVE_GLOBAL_CONCURRENCY = int(os.getenv('RESOLVE_GLOBAL_CONCURRENCY', max(1, EXTRACTOR_WORKERS - 2)))
+RESOLVE_PROGRESS_INTERVAL = 3 # Seconds between progress message edits
+
+# Stream recovery settings
+STREAM_RETRIES = int(os.getenv('STREAM_RETRIES', 3)) # Resume attempts per song after its stream drops
+EARLY_END_MARGIN = 10 # Seconds before the known end that still count as finishing normally
+
+# Skips requested within this many seconds of the previous one are treated as the same skip
+SKIP_COALESCE_SECONDS = 1.0
+
+# Failure handling settings
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', 10)) # Consecutive failures before playback stops
+FAILURE_BATCH = 4 # Queued songs resolved concurrently after a failure
+# yt-dlp errors that mean the video will not play no matter how often we retry
+DEAD_VIDEO_ERRORS = (
+    'video unavailable',
+    'private video',
+    'has been removed',
+    'no longer available',
+    'not available in your country',
+    'blocked it in your country',
+    'account associated with this video has been terminated',
+    'confirm your age',
+)
+
+def spotify_search_item(track):
+    """Builds the YouTube search for a Spotify track, keeping its IDs for the search memo."""
+    return {
+        'query': f"{track['artists'][0]['name']} - {track['name']}",
+        'spotify_id': track.get('id'),
+        'isrc': (track.get('external_ids') or {}).get('isrc'),
+    }
+
+def extraction_key(query):
+    """Key under which identical extractions are shared (same video, same search)."""
+    if query.startswith('ytsearch:'):
+        return f"ytsearch:{normalize_query(query)}"
+    if query.startswith('http'):
+        # Playlist links share a video ID with their first video, so keep them whole
+        return query if 'list=' in query else canonical_key(query)
+    return f"auto:{normalize_query(query)}"
+
+def parse_timestamp(text):
+    """Parses '90', '1:30' or '1:02:03' into seconds, or None if it is not a time."""
+    seconds = 0
+    for part in text.strip().split(':'):
+        if not part.isdigit():
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+class RestoredContext:
+    """Stands in for the command context of a player restored after a restart."""
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        if self.channel:
+            return await self.channel.send(*args, **kwargs)
 
 # Custom Check
 def ensure_voice():
@@ -26,13 +124,8 @@ def ensure_voice():
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queues = {}
-        self.loops = {} # 0: Off, 1: Current, 2: All
-        self.volumes = {} # {guild_id: volume_float}
-        self.current_song = {} # {guild_id: song_entry}
-        self.last_np_msg = {} # {guild_id: message}
-        self.start_times = {} # {guild_id: time.time()}
-        self.pause_starts = {} # {guild_id: time.time()}
+        self.players = {} # {guild_id: GuildPlayer}
+        self.resolve_slots = asyncio.Semaphore(RESOLVE_GLOBAL_CONCURRENCY)
         self.yt_dlp_options = {
             'format': 'bestaudio/best',
             'extractaudio': True,
@@ -67,108 +160,709 @@ class Music(commands.Cog):
             'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
             'options': '-vn',
         }
-        self.ytdl = yt_dlp.YoutubeDL(self.yt_dlp_options)
+        self.extractor = Extractor(self.yt_dlp_options)
+        self.inflight = SingleFlight() # Concurrent identical extractions share one call
+        self.audio_cache = None # Opt-in, opened in cog_load
+        self.governor = Governor() # Caps ffmpeg processes across all guilds
+        self.snapshot_task = None
+        self.restored = False
         
         # Spotify Init
         client_id = os.getenv('SPOTIPY_CLIENT_ID')
         client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
         if client_id and client_secret:
-            self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret))
+            self.sp = SpotifyClient(client_id, client_secret)
         else:
             self.sp = None
             print("Spotify credentials not found. Spotify support disabled.")
 
-    async def play_next(self, ctx):
-        guild_id = ctx.guild.id
-        loops = self.loops.get(guild_id, 0)
-        previous_song = self.current_song.get(guild_id)
-        
-        # Logic to determine next song
-        entry = None
-        
-        # If Loop Current (1) and we have a previous song, replay it
-        if loops == 1 and previous_song:
-            entry = previous_song
-            
-        # If Loop All (2) and we have a previous song, re-queue it
-        elif loops == 2 and previous_song:
-            if guild_id not in self.queues:
-                self.queues[guild_id] = []
-            self.queues[guild_id].append(previous_song)
-            
-        # If entry is still None (Loop Off or Loop All processed), get from queue
-        if not entry:
-            if guild_id in self.queues and self.queues[guild_id]:
-                entry = self.queues[guild_id].pop(0)
-            else:
-                # Queue empty
-                self.current_song[guild_id] = None
-                return
+    async def cog_load(self):
+        self.data_dir = os.getenv('DATA_DIR', 'data')
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.extract_cache = ExtractionCache(os.path.join(self.data_dir, 'music_cache.db'))
+        await self.extract_cache.open()
+        self.search_memo = SearchMemo(os.path.join(self.data_dir, 'music_cache.db'))
+        await self.search_memo.open()
+        if AUDIO_CACHE_ENABLED:
+            self.audio_cache = AudioCache(os.path.join(self.data_dir, 'music_cache.db'), os.path.join(self.data_dir, 'audio_cache'), governor=self.governor)
+            await self.audio_cache.open()
+            print(f"Audio Cache Initialized ({len(self.audio_cache.files)} files)")
+        print("Music Cache Initialized")
+        self.queue_store = QueueStore(os.path.join(self.data_dir, 'music_cache.db'))
+        await self.queue_store.open()
+        self.snapshot_task = asyncio.create_task(self.snapshot_loop())
+        self.governor.start()
 
-        # Play the entry
-        url = entry['url']
-        requester_id = entry.get('requester_id')
-        title = entry.get('title', 'Unknown Title')
-        
-        # Extract info (Full Extraction if it was flat)
-        loop = asyncio.get_event_loop()
+    async def cog_unload(self):
+        self.governor.stop()
+        self.snapshot_task.cancel()
+        # Final snapshot with exact positions, taken before the players are torn down
         try:
-            # Re-extract info using the URL (id-based URL preferred from flat extraction)
-            data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(url, download=False))
-            
+            await self.snapshot()
+        except Exception as e:
+            print(f"Final queue snapshot failed: {e}")
+        await self.queue_store.close()
+        for guild_id in list(self.players):
+            self.destroy_player(guild_id)
+        await self.extract_cache.close()
+        await self.search_memo.close()
+        if self.audio_cache:
+            await self.audio_cache.close()
+        if self.sp:
+            await self.sp.close()
+        self.extractor.shutdown()
+
+    def get_player(self, guild_id):
+        """Returns the guild's player, creating it on first use."""
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player
+
+    def destroy_player(self, guild_id):
+        """Drops every bit of playback state for a guild."""
+        player = self.players.pop(guild_id, None)
+        if player:
+            player.actor.close()
+            player.reset()
+
+    def player_stats(self):
+        """Returns (live players, approximate bytes used by all of them)."""
+        return len(self.players), sum(player.approx_size() for player in self.players.values())
+
+    async def snapshot(self):
+        """Saves what changed in every guild's queue and playback state."""
+        active = {}
+        for guild_id, player in self.players.items():
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if voice_client and voice_client.channel and (player.current or player.queue or player.playlist_feeds):
+                active[guild_id] = (player, voice_client.channel.id)
+        await self.queue_store.save(active)
+
+    async def snapshot_loop(self):
+        while True:
+            await asyncio.sleep(QUEUE_SNAPSHOT_INTERVAL)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                print(f"Queue snapshot failed: {e}")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after reconnects; restore only once per process
+        if self.restored:
+            return
+        self.restored = True
+        saved = await self.queue_store.load()
+        if saved:
+            results = await asyncio.gather(*(self.restore_player(state) for state in saved), return_exceptions=True)
+            restored = sum(1 for result in results if result is True)
+            print(f"♻️ Restored {restored}/{len(saved)} music players")
+
+    async def restore_player(self, state):
+        """Reconnects to the saved voice channel and continues the saved song and queue."""
+        guild = self.bot.get_guild(state['guild_id'])
+        channel = guild.get_channel(state['voice_channel_id']) if guild else None
+        if channel is None:
+            return False
+        if not guild.voice_client:
+            await channel.connect()
+
+        player = self.get_player(guild.id)
+        player.loop = state['loop']
+        player.volume = state['volume']
+        if state['filter'] in FILTERS:
+            player.filter = state['filter']
+            player.rate = FILTERS[state['filter']][1]
+        player.text_channel_id = state['text_channel_id']
+        player.queue.extend(state['queue'])
+        for url, next_index, requester_id, total in state['feeds']:
+            # Picks up at the saved page; the cursor is reopened from next_index on the first fetch
+            feed = PlaylistFeed(url, requester_id)
+            feed.next_index = next_index
+            feed.total = total
+            player.playlist_feeds.append(feed)
+        self.feed_playlists(player)
+
+        ctx = RestoredContext(guild, guild.get_channel(state['text_channel_id']) if state['text_channel_id'] else None)
+        if state['current']:
+            await player.actor.submit(self.resume_playback, ctx, state['current'], state['position'])
+        else:
+            await player.actor.submit(self.start_if_idle, ctx, key='start')
+        return True
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        # Bot was disconnected (kicked, channel deleted, !leave): forget the guild's player
+        if member.id == self.bot.user.id and before.channel and not after.channel:
+            self.destroy_player(member.guild.id)
+
+    async def extract(self, query):
+        """Extracts through the worker pool, joining an identical extraction already in flight."""
+        return await self.inflight.do(extraction_key(query), lambda: self.extractor.extract(query))
+
+    async def search_track(self, item, requester_id):
+        """Finds the YouTube entry for a Spotify search item, using the search memo when possible."""
+        query = item['query']
+        match = await self.search_memo.lookup(query, item.get('spotify_id'), item.get('isrc'))
+        if not match:
+            data = await self.extract(f"ytsearch:{query}")
+            if not data.get('entries'):
+                return None
+            track_data = data['entries'][0]
+            match = {
+                'url': track_data.get('webpage_url') or track_data.get('url'),
+                'title': track_data.get('title', query),
+            }
+            await self.search_memo.store(query, match['url'], match['title'], item.get('spotify_id'), item.get('isrc'))
+
+        return Track(match['url'], match['title'], requester_id)
+
+    async def resolve_entry(self, entry, fresh=False):
+        """
+        Returns (entry with title/duration/thumbnail filled in, stream info with 'stream_url' and 'acodec').
+        fresh=True ignores cached streams and local files and extracts a new stream URL.
+        """
+        url = entry.url
+        data = None if fresh else await self.extract_cache.get(url)
+
+        # Popular track stored on disk: no stream URL needed
+        local = self.audio_cache.path_for(url) if self.audio_cache and not fresh else None
+        if local and data:
+            return entry.with_info(data['title'], data['duration'], data['thumbnail']), {'stream_url': local, 'acodec': 'opus', 'local': True}
+
+        if not data or not data['stream_url']:
+            data = await self.extract(url)
+
             if 'entries' in data:
                 data = data['entries'][0]
-                
-            filename = data['url']
-            title = data.get('title', title) # Update title if we have better one
-            
-            # Update entry with full data for potential looping (and now playing info)
-            entry['title'] = title
-            entry['duration'] = data.get('duration')
-            entry['thumbnail'] = data.get('thumbnail')
-            # entry['url'] = data['webpage_url'] # Keep original URL for re-extraction or use stream url? 
-            # If we reuse entry for loop, we want the persistent URL, not the stream URL (filename).
-            # So typically we keep 'url' as the webpage/id url.
-            
-            self.current_song[guild_id] = entry # Update current song
-            self.start_times[guild_id] = time.time()
-            if guild_id in self.pause_starts:
-                del self.pause_starts[guild_id]
-            
-            source = discord.FFmpegPCMAudio(filename, **self.ffmpeg_options)
-            source = discord.PCMVolumeTransformer(source)
-            source.volume = self.volumes.get(guild_id, 0.5) # Default to 50%
+            data = await self.extract_cache.put(url, data) or {
+                'title': data.get('title'),
+                'duration': data.get('duration'),
+                'thumbnail': data.get('thumbnail'),
+                'stream_url': data['url'],
+                'acodec': data.get('acodec'),
+            }
 
-            
-            if ctx.voice_client and ctx.voice_client.is_connected():
-                 # Increment songs played for the requester
-                 if requester_id:
-                     leveling_cog = self.bot.get_cog('Leveling')
-                     if leveling_cog:
-                         await leveling_cog.increment_songs_played(requester_id, ctx.guild.id)
-
-                 ctx.voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop))
-                 view = MusicPlayerView(self, ctx)
-                 
-                 # Add loop status to now playing
-                 loop_msg = ""
-                 if loops == 1: loop_msg = "🔂 Loop Current"
-                 elif loops == 2: loop_msg = "🔁 Loop All"
-                 
-                 # Delete previous "Now Playing" message if it exists
-                 if guild_id in self.last_np_msg and self.last_np_msg[guild_id]:
-                     try:
-                        await self.last_np_msg[guild_id].delete()
-                     except:
-                        pass # Message might already be deleted
-
-                 msg = await ctx.send(f'Now playing: **{title}** {loop_msg}', view=view)
-                 self.last_np_msg[guild_id] = msg
-            
+        # The entry keeps the webpage/id url so loops can re-extract; the stream url expires.
+        return entry.with_info(data.get('title'), data.get('duration'), data.get('thumbnail')), data
+
+    def make_source(self, player, stream, position=0, duration=None):
+        """Builds the ffmpeg audio source for a resolved stream, starting at position seconds."""
+        # Reconnect flags only apply to HTTP inputs
+        before_options = '' if stream.get('local') else self.ffmpeg_options['before_options']
+        if position:
+            before_options += f" -ss {position:.2f}"
+
+        if PLAYBACK_MODE == 'pcm':
+            # discord.py encodes to Opus and scales volume in Python for every frame
+            options = self.ffmpeg_options['options']
+            filters = self.audio_filters(player, position, duration, volume=False)
+            if filters:
+                options += f' -af "{",".join(filters)}"'
+            source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(stream['stream_url'], before_options=before_options, options=options), volume=player.volume)
+            self.governor.track(source)
+            return source
+
+        # ffmpeg outputs Opus directly; volume is an ffmpeg filter instead of per-frame Python work
+        options = self.ffmpeg_options['options']
+        filters = self.audio_filters(player, position, duration)
+        if filters:
+            options += f' -af "{",".join(filters)}"'
+            codec = None # discord.py maps anything but 'opus' to libopus encoding
+        else:
+            # Nothing to change: codec='opus' makes discord.py pass YouTube's webm/opus through with -c:a copy
+            codec = 'opus' if stream.get('acodec') == 'opus' else None
+        source = discord.FFmpegOpusAudio(stream['stream_url'], bitrate=OPUS_BITRATE, codec=codec, before_options=before_options, options=options)
+        self.governor.track(source)
+        return source
+
+    def audio_filters(self, player, position=0, duration=None, volume=True):
+        """ffmpeg audio filter chain for the player's current settings."""
+        filters = []
+        if player.filter:
+            filters.append(FILTERS[player.filter][0])
+        if volume and player.volume != 1.0:
+            filters.append(f"volume={player.volume:.2f}")
+        if GAPLESS_ENABLED and CROSSFADE_SECONDS:
+            if not position:
+                filters.append(f"afade=t=in:d={CROSSFADE_SECONDS}")
+            if duration:
+                # Filter timestamps start at 0 after -ss and are scaled by speed effects
+                fade_start = max(0, (duration - position) / player.rate - CROSSFADE_SECONDS)
+                filters.append(f"afade=t=out:st={fade_start:.2f}:d={CROSSFADE_SECONDS}")
+        return filters
+
+    async def restart_source(self, voice_client, player, position=None):
+        """
+        Swaps in a new ffmpeg process for the current song at the given position (default: where it is now).
+        Replacing voice_client.source does not fire the after callback, so the queue is untouched.
+        """
+        if not player.current or not voice_client.source:
+            # Song ended while this was waiting in the mailbox
+            return
+        if position is None:
+            position = player.elapsed()
+        entry, stream = await self.resolve_entry(player.current)
+        paused = voice_client.is_paused()
+        old_source = voice_client.source
+        voice_client.source = self.make_source(player, stream, position, entry.duration)
+        if paused:
+            # Swapping the source resumes playback
+            voice_client.pause()
+        if old_source:
+            old_source.cleanup()
+
+        player.seek_to(position)
+        player.pause_start = time.time() if paused else None
+        # The prepared next source used the old settings and timing
+        self.schedule_gapless(player)
+
+    def start_resolver(self, ctx, items, added_count=0):
+        """Resolves Spotify search items in the background and queues them in playlist order."""
+        player = self.get_player(ctx.guild.id)
+        task = asyncio.create_task(self.resolve_tracks(ctx, player, items, added_count))
+        player.resolver_tasks.add(task)
+        task.add_done_callback(player.resolver_tasks.discard)
+
+    async def resolve_tracks(self, ctx, player, items, added_count=0):
+        results = [None] * len(items)
+        finished = [False] * len(items)
+        next_index = 0 # Next item a worker should pick up
+        next_insert = 0 # Next item to insert into the queue (keeps playlist order)
+        progress_msg = await ctx.send(f"⏳ Adding Spotify tracks... 0/{len(items)}")
+        last_progress = time.time()
+
+        def flush():
+            nonlocal next_insert, added_count
+            queue = player.queue
+            was_empty = not queue
+            while next_insert < len(items) and finished[next_insert]:
+                if results[next_insert]:
+                    queue.append(results[next_insert])
+                    added_count += 1
+                results[next_insert] = None
+                next_insert += 1
+            if was_empty and queue:
+                self.schedule_prefetch(player)
+
+        async def worker():
+            nonlocal next_index, last_progress
+            while next_index < len(items):
+                i = next_index
+                next_index += 1
+                try:
+                    async with self.resolve_slots:
+                        results[i] = await self.search_track(items[i], ctx.author.id)
+                except Exception as e:
+                    print(f"Failed to find {items[i]['query']}: {e}")
+                finished[i] = True
+                flush()
+
+                if time.time() - last_progress >= RESOLVE_PROGRESS_INTERVAL:
+                    last_progress = time.time()
+                    try:
+                        await progress_msg.edit(content=f"⏳ Adding Spotify tracks... {next_insert}/{len(items)}")
+                    except discord.HTTPException:
+                        pass
+
+        await asyncio.gather(*(worker() for _ in range(min(RESOLVE_CONCURRENCY, len(items)))))
+        await progress_msg.edit(content=f"✅ Finished adding all {added_count} Spotify tracks to queue.")
+
+    def schedule_prefetch(self, player):
+        """Starts resolving the head of the queue in the background while the current song plays."""
+        # The head of the queue may have changed, so a prepared gapless source may be for the wrong song
+        if not (player.next_source and player.next_source[0] is player.upcoming()):
+            self.schedule_gapless(player)
+        if player.prefetch_task and not player.prefetch_task.done():
+            return
+        player.prefetch_task = asyncio.create_task(self.prefetch(player))
+
+    async def prefetch(self, player):
+        for entry in list(player.queue.islice(0, PREFETCH_DEPTH)):
+            # Resolving fills the extraction cache, which play_next reads from
+            if self.extract_cache.has_fresh_stream(entry.url) or self.extract_cache.is_dead(entry.url) or (self.audio_cache and self.audio_cache.path_for(entry.url)):
+                continue
+            task = asyncio.create_task(self.resolve_entry(entry))
+            player.prefetching = (entry, task)
+            try:
+                await task
+            except Exception as e:
+                # play_next will retry and report the error when it gets there
+                print(f"Prefetch failed for {entry.url}: {e}")
+            finally:
+                player.prefetching = None
+
+    async def wait_for_prefetch(self, player, entry):
+        """If the entry is being resolved in the background right now, wait for that instead of extracting twice."""
+        pending = player.prefetching
+        if pending and pending[0] is entry:
+            await asyncio.wait([pending[1]])
+
+    def after_playback(self, ctx):
+        """The voice client's after callback; runs in the audio thread and hands the song end to the guild's actor."""
+        return lambda e: self.bot.loop.call_soon_threadsafe(self.post_track_finished, ctx, e)
+
+    def post_track_finished(self, ctx, error):
+        player = self.players.get(ctx.guild.id)
+        if player:
+            player.actor.submit(self.track_finished, ctx, error)
+
+    # Actor operations: these run one at a time per guild, in the order they were requested
+
+    async def start_if_idle(self, ctx):
+        """Starts playback unless a song is already playing. Checked inside the actor, so two !play can't both start one."""
+        player = self.players.get(ctx.guild.id)
+        if player is None:
+            return
+        player.text_channel_id = ctx.channel.id if ctx.channel else None
+        voice_client = ctx.voice_client
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+            self.schedule_prefetch(player)
+            return
+        await self.play_next(ctx)
+
+    async def resume_playback(self, ctx, entry, position):
+        """Plays a restored song from where it was. Metadata comes from the snapshot; only the stream may need resolving."""
+        player = self.players.get(ctx.guild.id)
+        if player is None:
+            return
+        try:
+            resolved, stream = await self.resolve_entry(entry)
+            source = self.make_source(player, stream, position, resolved.duration)
         except Exception as e:
-            print(f"Error processing song: {e}")
-            await ctx.send(f"Error playing **{title}**. Skipping...")
+            print(f"Could not resume {entry.url}: {e}")
             await self.play_next(ctx)
+            return
+        self.start_playback(ctx, player, resolved, stream, source, position)
+        self.schedule_prefetch(player)
+        await ctx.send(
+            f"♻️ Back after a restart: resuming **{resolved.title}** at **{datetime.timedelta(seconds=int(position))}** "
+            f"with **{len(player.queue)}** songs queued."
+        )
+
+    async def skip_current(self, player, voice_client):
+        if voice_client.is_playing() or voice_client.is_paused():
+            player.stop_requested = True
+            voice_client.stop()
+
+    async def stop_playback(self, player, voice_client):
+        # Clears the queue, loop mode and the "Now playing" message reference
+        player.reset()
+        voice_client.stop()
+
+    async def apply_filter(self, player, voice_client, name):
+        # Keep the song position across the rate change
+        position = player.elapsed()
+        player.filter = None if name == 'off' else name
+        player.rate = FILTERS[name][1] if player.filter else 1.0
+        if voice_client and voice_client.source and player.current:
+            await self.restart_source(voice_client, player, position)
+
+    def request_skip(self, player, voice_client):
+        """Queues a skip, dropping repeats (button spam). Returns the pending operation, or None if it was a repeat."""
+        now = time.monotonic()
+        if now - player.last_skip < SKIP_COALESCE_SECONDS:
+            player.actor.stats['coalesced'] += 1
+            return None
+        player.last_skip = now
+        return player.actor.submit(self.skip_current, player, voice_client, key='skip')
+
+    def ended_early(self, player):
+        """True if the current song stopped well before its known duration without anyone skipping it."""
+        entry = player.current
+        if not entry or not entry.duration or player.stop_requested:
+            return False
+        return player.elapsed() < entry.duration - EARLY_END_MARGIN
+
+    async def track_finished(self, ctx, error=None):
+        if error:
+            print(f"Player error: {error}")
+        player = self.players.get(ctx.guild.id)
+        if player and self.ended_early(player) and await self.recover_stream(ctx, player):
+            return
+        await self.play_next(ctx)
+
+    async def recover_stream(self, ctx, player):
+        """
+        Restarts the current song where it stopped after its stream died (expired URL, 403, dropped connection).
+        Returns True if playback resumed.
+        """
+        entry = player.current
+        if player.retries >= STREAM_RETRIES:
+            player.recovery_failures += 1
+            print(f"Giving up on {entry.url} after {player.retries} stream recoveries")
+            return False
+        player.retries += 1
+        position = player.elapsed()
+
+        try:
+            # The cached stream URL is the one that just failed, so extract a new one
+            _, stream = await self.resolve_entry(entry, fresh=True)
+            source = self.make_source(player, stream, position, entry.duration)
+        except Exception as e:
+            print(f"Stream recovery failed for {entry.url}: {e}")
+            player.recovery_failures += 1
+            return False
+
+        voice_client = ctx.voice_client
+        if self.players.get(ctx.guild.id) is not player or player.current is not entry:
+            # Left, stopped or skipped while we were re-resolving
+            source.cleanup()
+            return True
+        if not voice_client or not voice_client.is_connected() or voice_client.is_playing() or voice_client.is_paused():
+            source.cleanup()
+            return voice_client is not None and voice_client.is_connected()
+
+        voice_client.play(source, after=self.after_playback(ctx))
+        player.seek_to(position)
+        player.pause_start = None
+        player.recovered += 1
+        self.schedule_gapless(player)
+        print(f"🔄 Resumed {entry.title} at {int(position)}s (attempt {player.retries}/{STREAM_RETRIES})")
+        return True
+
+    def feed_playlists(self, player):
+        """Fetches the next playlist page in the background once the queue runs low."""
+        if player.playlist_feeds and len(player.queue) < PLAYLIST_LOW_WATER:
+            self.pull_playlist_page(player)
+
+    def pull_playlist_page(self, player):
+        """Returns the page fetch task, starting one if none is running."""
+        if not player.feed_task or player.feed_task.done():
+            player.feed_task = asyncio.create_task(self.load_playlist_page(player))
+        return player.feed_task
+
+    async def load_playlist_page(self, player):
+        """
+        Queues the next page of the oldest playlist. Returns how many songs were added.
+        A page that keeps failing ends that playlist (the user is told) and the next one is tried.
+        """
+        while player.playlist_feeds:
+            feed = player.playlist_feeds[0]
+            for attempt in range(PLAYLIST_PAGE_RETRIES):
+                try:
+                    entries = await self.fetch_playlist_page(feed)
+                    break
+                except Exception as e:
+                    error = e
+                    print(f"Failed to load playlist page at {feed.next_index} of {feed.url} (attempt {attempt + 1}/{PLAYLIST_PAGE_RETRIES}): {e}")
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                player.playlist_feeds.popleft()
+                feed.close()
+                await self.notify(player, f"⚠️ Couldn't load more of a playlist after {feed.added} songs, skipping the rest of it: {error}")
+                continue
+
+            if feed.done:
+                player.playlist_feeds.popleft()
+                feed.close()
+            was_empty = not player.queue
+            player.queue.extend(Track.from_info(entry, feed.requester_id) for entry in entries)
+            if was_empty and entries:
+                self.schedule_prefetch(player)
+            return len(entries)
+        return 0
+
+    async def fetch_playlist_page(self, feed):
+        """Reads the feed's next page, continuing its lazy cursor when the extractor can keep one."""
+        if feed.lazy and feed.cursor is None:
+            feed.cursor = await self.extractor.open_playlist(feed.url, feed.next_index)
+            feed.lazy = feed.cursor is not None
+        if feed.cursor:
+            try:
+                read, entries = await self.extractor.playlist_page(feed.cursor, PLAYLIST_PAGE_SIZE)
+            except Exception:
+                # The worker may still be inside the generator; the next attempt opens a fresh one
+                feed.cursor = None
+                raise
+            return feed.advance_lazy(entries, read)
+        # Process mode: fetch just this page by index
+        data = await self.extractor.extract(feed.url, **feed.page_options())
+        return feed.advance(data)
+
+    async def notify(self, player, message):
+        """Sends a message to the channel the player was started from, if it still exists."""
+        channel = self.bot.get_channel(player.text_channel_id) if player.text_channel_id else None
+        if channel:
+            try:
+                await channel.send(message)
+            except Exception as e:
+                print(f"Failed to send notice: {e}")
+
+    def schedule_gapless(self, player):
+        """Gapless mode: (re)arms the timer that prepares the next song shortly before the current one ends."""
+        player.cancel_gapless()
+        entry = player.current
+        if not GAPLESS_ENABLED or not entry or not entry.duration:
+            return
+        remaining = (entry.duration - player.elapsed()) / player.rate
+        player.gapless_task = asyncio.create_task(self.prepare_next(player, max(0, remaining - GAPLESS_LEAD)))
+
+    async def prepare_next(self, player, delay):
+        """Starts the next song's ffmpeg and reads its first seconds, so play_next can switch to it instantly."""
+        await asyncio.sleep(delay)
+        entry = player.upcoming()
+        if entry is None or self.governor.saturated():
+            # A second ffmpeg per guild is a luxury when the machine is saturated
+            return
+
+        source = None
+        try:
+            await self.wait_for_prefetch(player, entry)
+            resolved, stream = await self.resolve_entry(entry)
+            source = PrebufferedSource(self.make_source(player, stream, duration=resolved.duration), GAPLESS_BUFFER_KB * 1024)
+            await asyncio.get_running_loop().run_in_executor(None, source.fill, PREBUFFER_SECONDS * 50)
+        except asyncio.CancelledError:
+            if source:
+                source.cleanup()
+            raise
+        except Exception as e:
+            # play_next falls back to starting the song cold
+            print(f"Gapless prebuffer failed for {entry.url}: {e}")
+            if source:
+                source.cleanup()
+            return
+        player.next_source = (entry, resolved, stream, source)
+
+    def next_entry(self, player):
+        """Picks the song to play after the current one, applying the loop mode. None when the queue is done."""
+        previous_song = player.current
+        # If Loop Current (1) and we have a previous song, replay it
+        if player.loop == 1 and previous_song:
+            return previous_song
+        # If Loop All (2) and we have a previous song, re-queue it
+        if player.loop == 2 and previous_song:
+            player.queue.append(previous_song)
+        return player.queue.popleft() if player.queue else None
+
+    def resolve_ahead(self, player, pending):
+        """After a failure, resolves the next few queued songs concurrently so a run of dead videos is skipped quickly."""
+        for entry in player.queue.islice(0, FAILURE_BATCH):
+            if entry not in pending and not self.extract_cache.is_dead(entry.url):
+                pending[entry] = asyncio.create_task(self.resolve_entry(entry))
+
+    async def play_next(self, ctx):
+        guild_id = ctx.guild.id
+        player = self.players.get(guild_id)
+        if player is None:
+            # Player was torn down (left the channel) while a song was ending
+            return
+        loops = player.loop
+        failed = [] # Titles skipped in this call, reported in one message
+        tripped = False
+        pending = {} # {entry: resolve task} started ahead after a failure
+
+        try:
+            # Loop instead of recursing, so a playlist of dead videos cannot blow the stack
+            while True:
+                entry = self.next_entry(player)
+                if entry is None:
+                    while not player.queue and player.playlist_feeds:
+                        # Queue drained faster than pages were fetched; a page can come back
+                        # empty (unavailable videos) or a playlist can fail, so keep going
+                        # wait() instead of await: a feed cancelled by !stop just ends the loop here
+                        await asyncio.wait([self.pull_playlist_page(player)])
+                    if player.queue:
+                        continue
+                    # Queue empty
+                    player.current = None
+                    return
+
+                if self.extract_cache.is_dead(entry.url):
+                    failed.append(entry.title)
+                    player.current = None # Don't loop or re-queue it
+                    continue
+
+                try:
+                    prepared = player.take_next_source(entry)
+                    if prepared:
+                        # Gapless: ffmpeg is already running and its first seconds are buffered
+                        entry, stream, source = prepared
+                    elif entry in pending:
+                        entry, stream = await pending.pop(entry)
+                        source = self.make_source(player, stream, duration=entry.duration)
+                    else:
+                        # Use the prefetched stream if it is still valid, otherwise (re-)extract now
+                        await self.wait_for_prefetch(player, entry)
+                        entry, stream = await self.resolve_entry(entry)
+                        source = self.make_source(player, stream, duration=entry.duration)
+                except Exception as e:
+                    print(f"Error processing song {entry.url}: {e}")
+                    failed.append(entry.title)
+                    player.current = None
+                    player.failures += 1
+                    if any(marker in str(e).lower() for marker in DEAD_VIDEO_ERRORS):
+                        await self.extract_cache.mark_dead(entry.url, str(e))
+
+                    if player.failures >= CIRCUIT_BREAKER_FAILURES:
+                        # Circuit breaker: stop hammering YouTube until someone asks again
+                        tripped = True
+                        return
+                    self.resolve_ahead(player, pending)
+                    continue
+
+                self.start_playback(ctx, player, entry, stream, source)
+                break
+        finally:
+            # Let songs resolved ahead finish into the cache; their errors are reported when they are reached
+            for task in pending.values():
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            if failed:
+                names = ", ".join(f"**{title}**" for title in failed[:5])
+                more = f" and {len(failed) - 5} more" if len(failed) > 5 else ""
+                await ctx.send(f"⚠️ Skipped {len(failed)} unplayable song(s): {names}{more}")
+            if tripped:
+                await ctx.send(
+                    f"🛑 **{player.failures}** songs in a row could not be played, so playback stopped. "
+                    f"**{len(player.queue)}** songs are still queued; use `!play` to try again."
+                )
+
+        if not ctx.voice_client or not ctx.voice_client.is_connected():
+            return
+        # Increment songs played for the requester (after play() to keep it off the gap)
+        if entry.requester_id:
+            leveling_cog = self.bot.get_cog('Leveling')
+            if leveling_cog:
+                await leveling_cog.increment_songs_played(entry.requester_id, ctx.guild.id)
+
+        view = MusicPlayerView(self, ctx)
+        
+        # Add loop status to now playing
+        loop_msg = ""
+        if loops == 1: loop_msg = "🔂 Loop Current"
+        elif loops == 2: loop_msg = "🔁 Loop All"
+        
+        # Delete previous "Now Playing" message if it exists
+        if player.np_msg:
+            try:
+               await player.np_msg.delete()
+            except:
+               pass # Message might already be deleted
+
+        msg = await ctx.send(f'Now playing: **{entry.title}** {loop_msg}', view=view)
+        player.np_msg = msg
+
+        # Counts toward storing the track on disk (downloads run in the background)
+        if self.audio_cache:
+            await self.audio_cache.record_play(entry.url, stream)
+
+        # Resolve the next song while this one plays
+        self.schedule_prefetch(player)
+        self.feed_playlists(player)
+
+    def start_playback(self, ctx, player, entry, stream, source, position=0):
+        player.current = entry # Update current song
+        player.seek_to(position)
+        player.pause_start = None
+        player.stop_requested = False
+        player.retries = 0
+        player.failures = 0
+        if ctx.voice_client and ctx.voice_client.is_connected():
+            ctx.voice_client.play(source, after=self.after_playback(ctx))
+        else:
+            source.cleanup()
 
     @commands.command(name='join', aliases=['j'])
     async def play_join(self, ctx):
@@ -185,15 +879,8 @@ class Music(commands.Cog):
     @commands.command(name='leave', aliases=['l', 'dc'])
     async def play_leave(self, ctx):
         if ctx.voice_client:
+            self.destroy_player(ctx.guild.id)
             await ctx.voice_client.disconnect()
-            if ctx.guild.id in self.queues:
-                del self.queues[ctx.guild.id]
-            if ctx.guild.id in self.current_song:
-                del self.current_song[ctx.guild.id]
-            if ctx.guild.id in self.loops:
-                del self.loops[ctx.guild.id]
-            if ctx.guild.id in self.last_np_msg:
-                del self.last_np_msg[ctx.guild.id]
             await ctx.send('Left the channel')
         else:
             await ctx.send('I am not in a voice channel!')
@@ -201,9 +888,12 @@ class Music(commands.Cog):
     @commands.command(name='loop', aliases=['lp'])
     async def loop(self, ctx):
         """Cycles loop mode: Off -> Current -> All -> Off"""
-        current_state = self.loops.get(ctx.guild.id, 0)
-        new_state = (current_state + 1) % 3
-        self.loops[ctx.guild.id] = new_state
+        # Players are only created while connected; destroy_player drops them on disconnect
+        if not ctx.voice_client:
+            return await ctx.send("Not connected to a voice channel.")
+        player = self.get_player(ctx.guild.id)
+        new_state = (player.loop + 1) % 3
+        player.loop = new_state
         
         msg = "Loop disabled ➡️"
         if new_state == 1:
@@ -216,6 +906,13 @@ class Music(commands.Cog):
     @commands.command(name='play', aliases=['p'])
     @ensure_voice()
     async def play(self, ctx, *, query):
+        # Starting a new player means one more ffmpeg process; hold it back while the machine is saturated
+        if not ctx.voice_client or not (ctx.voice_client.is_playing() or ctx.voice_client.is_paused()):
+            if self.governor.saturated():
+                await ctx.send("⏳ The bot is very busy right now, waiting for a free slot...")
+            if not await self.governor.admit():
+                return await ctx.send("🚦 The bot is at capacity right now. Please try again in a minute.")
+
         if not ctx.voice_client:
             try:
                 if ctx.author.voice:
@@ -226,10 +923,11 @@ class Music(commands.Cog):
             except Exception as e:
                 await ctx.send(f"Could not join channel: {e}")
                 return
+
+        # A new request closes the circuit breaker
+        self.get_player(ctx.guild.id).failures = 0
             
         try:
-            loop = asyncio.get_event_loop()
-
             if "spotify.com" in query or "spotify:" in query:
                 if not self.sp:
                     await ctx.send("Spotify support is not configured (missing credentials).")
@@ -237,35 +935,9 @@ class Music(commands.Cog):
 
                 await ctx.send("Spotify link detected. Fetching tracks...")
                 
-                tracks_to_search = []
-                
                 try:
-                    if "track" in query:
-                        track = self.sp.track(query)
-                        tracks_to_search.append(f"{track['artists'][0]['name']} - {track['name']}")
-                    
-                    elif "playlist" in query:
-                        results = self.sp.playlist_tracks(query)
-                        tracks = results['items']
-                        while results['next']:
-                            results = self.sp.next(results)
-                            tracks.extend(results['items'])
-                        
-                        for item in tracks:
-                            track = item.get('track')
-                            if track:
-                                tracks_to_search.append(f"{track['artists'][0]['name']} - {track['name']}")
-                                
-                    elif "album" in query:
-                        results = self.sp.album_tracks(query)
-                        tracks = results['items']
-                        while results['next']:
-                            results = self.sp.next(results)
-                            tracks.extend(results['items'])
-                        
-                        for track in tracks:
-                            tracks_to_search.append(f"{track['artists'][0]['name']} - {track['name']}")
-                            
+                    tracks = await self.sp.resolve(query)
+                    tracks_to_search = [spotify_search_item(track) for track in tracks]
                 except Exception as e:
                     await ctx.send(f"Error fetching Spotify data: {e}")
                     return
@@ -277,23 +949,14 @@ class Music(commands.Cog):
                 await ctx.send(f"Found {len(tracks_to_search)} tracks. Adding to queue...")
 
                 # Optimization: Process first track immediately to start playing, then add rest
-                first_query = tracks_to_search[0]
+                first_query = tracks_to_search[0]['query']
                 
                 try:
-                    data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(f"ytsearch:{first_query}", download=False))
-                    if 'entries' in data and data['entries']:
-                        track_data = data['entries'][0]
-                        entry = {
-                            'url': track_data.get('webpage_url'),
-                            'title': track_data.get('title', first_query),
-                            'requester_id': ctx.author.id
-                        }
-                        if ctx.guild.id not in self.queues:
-                            self.queues[ctx.guild.id] = []
-                        self.queues[ctx.guild.id].append(entry)
-                        
-                        if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
-                            await self.play_next(ctx)
+                    entry = await self.search_track(tracks_to_search[0], ctx.author.id)
+                    if entry:
+                        player = self.get_player(ctx.guild.id)
+                        player.queue.append(entry)
+                        await player.actor.submit(self.start_if_idle, ctx, key='start')
                     else:
                          await ctx.send(f"Could not find **{first_query}** on YouTube.")
 
@@ -301,40 +964,57 @@ class Music(commands.Cog):
                     print(f"Failed to find first track {first_query}: {e}")
 
                 # Process remaining tracks in background
-                async def add_remaining_tracks():
-                    added_count = 1 
-                    for search_query in tracks_to_search[1:]:
-                        try:
-                            data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(f"ytsearch:{search_query}", download=False))
-                            if 'entries' in data and data['entries']:
-                                track_data = data['entries'][0]
-                                entry = {
-                                    'url': track_data.get('webpage_url'),
-                                    'title': track_data.get('title', search_query),
-                                    'requester_id': ctx.author.id
-                                }
-                                self.queues[ctx.guild.id].append(entry)
-                                added_count += 1
-                        except Exception as e:
-                            print(f"Failed to find {search_query}: {e}")
-                            continue
-                            
-                    await ctx.send(f"✅ Finished adding all {added_count} Spotify tracks to queue.")
-
-                asyncio.create_task(add_remaining_tracks())
+                if len(tracks_to_search) > 1:
+                    self.start_resolver(ctx, tracks_to_search[1:], added_count=1)
+                else:
+                    await ctx.send("✅ Finished adding all 1 Spotify tracks to queue.")
                 return
 
             await ctx.send(f"Searching for **{query}**...")
-            data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(query, download=False))
+
+            # Single video we have seen before: queue it straight from the cache
+            cached = None
+            if query.startswith('http') and 'list=' not in query:
+                cached = await self.extract_cache.get(query)
+
+            # Free-text search we have answered before: skip the yt-dlp search
+            elif not query.startswith('http'):
+                cached = await self.search_memo.lookup(query)
+                if cached:
+                    cached['webpage_url'] = cached['url']
+
+            feed = None
+            if cached:
+                data = {
+                    'webpage_url': cached['webpage_url'],
+                    'title': cached['title'],
+                }
+            elif query.startswith('http') and 'list=' in query:
+                # Playlists are fetched a page at a time; the rest is queued as the queue drains
+                feed = PlaylistFeed(query, ctx.author.id)
+                data = await self.extractor.extract(query, **feed.page_options())
+            else:
+                data = await self.extract(query)
+                if 'entries' not in data:
+                    await self.extract_cache.put(query, data)
+                elif data['entries'] and not query.startswith('http'):
+                    # default_search wraps free text in a ytsearch result whose _type is 'playlist'
+                    match = data['entries'][0]
+                    await self.search_memo.store(query, match.get('webpage_url') or match.get('url'), match.get('title'))
             
             tracks_to_add = []
             
             if 'entries' in data:
                 # Playlist or Search Result
-                if data.get('_type') == 'playlist' and not query.startswith('ytsearch'):
+                if data.get('_type') == 'playlist' and query.startswith('http'):
                     # It's a proper playlist URL
-                    tracks_to_add = data['entries']
-                    await ctx.send(f"Found playlist with {len(tracks_to_add)} songs.")
+                    if feed:
+                        tracks_to_add = feed.advance(data)
+                        total = feed.total or f"{len(tracks_to_add)}+"
+                        await ctx.send(f"Found playlist with {total} songs.")
+                    else:
+                        tracks_to_add = data['entries']
+                        await ctx.send(f"Found playlist with {len(tracks_to_add)} songs.")
                 else:
                     # Search result, just take first
                     tracks_to_add = [data['entries'][0]]
@@ -346,38 +1026,108 @@ class Music(commands.Cog):
                 await ctx.send("No songs found.")
                 return
 
-            if ctx.guild.id not in self.queues:
-                self.queues[ctx.guild.id] = []
+            player = self.get_player(ctx.guild.id)
                 
             added_count = 0
+            first_title = tracks_to_add[0].get('title')
             for track in tracks_to_add:
-                entry = {
-                    'url': track.get('original_url') or track.get('webpage_url') or track.get('url'),
-                    'title': track.get('title', 'Unknown Title'),
-                    'requester_id': ctx.author.id
-                }
-                self.queues[ctx.guild.id].append(entry)
+                player.queue.append(Track.from_info(track, ctx.author.id))
                 added_count += 1
+            # Drop the raw info dicts now; only the compact Tracks stay queued
+            del tracks_to_add, data
+            paged = feed is not None and feed.added and not feed.done
+            if paged:
+                player.playlist_feeds.append(feed)
+                self.feed_playlists(player)
             
             if added_count == 1:
-                await ctx.send(f"Added to queue: **{tracks_to_add[0].get('title')}**")
+                await ctx.send(f"Added to queue: **{first_title}**")
+            elif paged:
+                await ctx.send(f"Added **{added_count}** songs to queue. The rest of the playlist is added as the queue plays.")
             else:
                 await ctx.send(f"Added **{added_count}** songs to queue.")
 
             # If not playing, start playing
-            if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
-                await self.play_next(ctx)
+            await player.actor.submit(self.start_if_idle, ctx, key='start')
                 
         except Exception as e:
             print(f"Play error: {e}")
             await ctx.send("An error occurred while searching/playing. Make sure it's a valid link or search term.")
 
+    @commands.command(name='forget', aliases=['badmatch'])
+    @commands.has_permissions(manage_messages=True)
+    async def forget(self, ctx, *, query):
+        """Removes a wrong search match (by search text, Spotify track link or YouTube link)."""
+        spotify_match = re.search(r'track[/:]([A-Za-z0-9]+)', query) if "spotify" in query else None
+        if spotify_match:
+            removed = await self.search_memo.forget(spotify_id=spotify_match.group(1))
+        elif query.startswith('http'):
+            removed = await self.search_memo.forget(url=query)
+        else:
+            removed = await self.search_memo.forget(query=query)
+
+        if removed:
+            await ctx.send(f"🧹 Forgot **{removed}** saved match(es). The next play will search again.")
+        else:
+            await ctx.send("No saved match found for that.")
+
+    @commands.command(name='players')
+    @commands.is_owner()
+    async def players_info(self, ctx):
+        """Shows how many guild players are alive and roughly how much memory they use."""
+        count, size = self.player_stats()
+        queued = sum(len(player.queue) for player in self.players.values())
+        recovered = sum(player.recovered for player in self.players.values())
+        failed = sum(player.recovery_failures for player in self.players.values())
+        ops = sum(player.actor.stats['ops'] for player in self.players.values())
+        coalesced = sum(player.actor.stats['coalesced'] for player in self.players.values())
+        await ctx.send(
+            f"🎛️ **{count}** active players • **{queued}** queued songs • ~**{size / 1024 / 1024:.2f} MB**\n"
+            f"🔄 **{recovered}** dropped streams resumed • **{failed}** given up\n"
+            f"📬 **{ops}** player operations • **{coalesced}** repeats merged"
+        )
+
+    @commands.command(name='load')
+    @commands.is_owner()
+    async def load_info(self, ctx):
+        """Shows ffmpeg process count, their CPU/memory use and admission stats."""
+        governor = self.governor
+        live = governor.live()
+        admission = governor.stats
+        status = "🔴 saturated" if governor.saturated() else "🟢 ok"
+        shared = self.inflight.stats
+        await ctx.send(
+            f"🖥️ **Load:** {status} • machine CPU **{governor.system_cpu:.0f}%** (limit {governor.max_cpu:.0f}%)\n"
+            f"🎬 **ffmpeg:** {live}/{governor.max_processes} processes • {governor.ffmpeg_cpu:.0f}% of a core • {governor.ffmpeg_rss / 1024 / 1024:.1f} MB RSS\n"
+            f"📥 **yt-dlp:** {self.extractor.active} running/queued • {self.extractor.stats['jobs']} jobs • {self.extractor.stats['timeouts']} timeouts • {shared['coalesced']}/{shared['calls']} calls shared an in-flight extraction\n"
+            f"🚦 **Admission:** {admission['admitted']} admitted • {admission['waited']} waited • {admission['rejected']} rejected"
+        )
+
+    @commands.command(name='cache')
+    @commands.is_owner()
+    async def cache_info(self, ctx):
+        """Shows cache sizes and hit rates."""
+        extract = self.extract_cache.stats
+        lines = [
+            f"📇 **Extraction cache:** {self.extract_cache.hit_rate():.0%} hits • {extract['stream_hits']} fresh streams / {extract['stream_misses']} re-extracted • {extract['evictions']} evicted",
+            f"🔎 **Search memo:** {self.search_memo.stats['hits']} hits / {self.search_memo.stats['misses']} misses",
+        ]
+        if self.audio_cache:
+            audio = self.audio_cache
+            lines.append(
+                f"💾 **Audio cache:** {len(audio.files)} files • {audio.total_bytes / 1024 / 1024:.1f} / {audio.max_bytes / 1024 / 1024:.0f} MB • "
+                f"{audio.hit_rate():.0%} of plays from disk • {len(audio.downloads)} downloading • {audio.stats['deferred']} deferred • {audio.stats['evictions']} evicted"
+            )
+        else:
+            lines.append("💾 **Audio cache:** disabled (set `AUDIO_CACHE_ENABLED=true`)")
+        await ctx.send("\n".join(lines))
+
     @commands.command(name='pause', aliases=['ps'])
     @ensure_voice()
     async def pause(self, ctx):
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
-            self.pause_starts[ctx.guild.id] = time.time()
+            self.get_player(ctx.guild.id).pause_start = time.time()
             await ctx.send("Paused ⏸️")
 
     @commands.command(name='resume', aliases=['res'])
@@ -385,38 +1135,29 @@ class Music(commands.Cog):
     async def resume(self, ctx):
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
-            if ctx.guild.id in self.pause_starts:
-                paused_duration = time.time() - self.pause_starts[ctx.guild.id]
-                if ctx.guild.id in self.start_times:
-                    self.start_times[ctx.guild.id] += paused_duration
-                del self.pause_starts[ctx.guild.id]
+            self.get_player(ctx.guild.id).resume()
             await ctx.send("Resumed ▶️")
 
     @commands.command(name='stop', aliases=['st'])
     @ensure_voice()
     async def stop(self, ctx):
         if ctx.voice_client:
-            ctx.voice_client.stop()
-            self.queues[ctx.guild.id] = []
-            self.current_song[ctx.guild.id] = None
-            self.loops[ctx.guild.id] = 0
-            
-            # Clean up the last "Now playing" message reference, but maybe not delete it on stop?
-            # Or should we? The user asked for "when next song plays".
-            # I'll just clear the reference so we don't try to delete an old one next time we restart.
-            if ctx.guild.id in self.last_np_msg:
-                del self.last_np_msg[ctx.guild.id]
+            player = self.get_player(ctx.guild.id)
+            await player.actor.submit(self.stop_playback, player, ctx.voice_client, key='stop')
 
             await ctx.send("Stopped and cleared queue.")
 
     @commands.command(name='queue', aliases=['q'])
     @ensure_voice()
     async def queue(self, ctx):
-        if ctx.guild.id in self.queues and self.queues[ctx.guild.id]:
-            queue_list = self.queues[ctx.guild.id]
+        player = self.players.get(ctx.guild.id)
+        if player and player.queue:
+            queue_list = player.queue
             
             # Use Pagination View
-            view = QueuePaginationView(ctx, queue_list)
+            # Playlist songs not fetched yet (only known once YouTube reports the playlist size)
+            pending = sum(feed.remaining() for feed in player.playlist_feeds)
+            view = QueuePaginationView(ctx, queue_list, pending)
             embed = view.get_embed()
             view.update_buttons()
             
@@ -431,11 +1172,12 @@ class Music(commands.Cog):
             return await ctx.send("Nothing is playing.")
 
         if index is not None:
-            if ctx.guild.id not in self.queues or not self.queues[ctx.guild.id]:
+            player = self.get_player(ctx.guild.id)
+            if not player.queue:
                 return await ctx.send("Queue is empty, cannot skip to specific index.")
             
-            if index < 1 or index > len(self.queues[ctx.guild.id]):
-                 return await ctx.send(f"Invalid index. Please provide a number between 1 and {len(self.queues[ctx.guild.id])}.")
+            if index < 1 or index > len(player.queue):
+                 return await ctx.send(f"Invalid index. Please provide a number between 1 and {len(player.queue)}.")
             
             # Skip to specific index (Move to Top):
             # We want to play the song at index (1-based) next.
@@ -445,15 +1187,65 @@ class Music(commands.Cog):
             # Insert C at 0. Queue: [C, A, B, D].
             # Then stop() triggers play_next(), which plays C.
             
-            target_song = self.queues[ctx.guild.id].pop(index-1)
-            self.queues[ctx.guild.id].insert(0, target_song)
+            target_song = player.queue.move(index-1, 0)
+            self.schedule_prefetch(player)
             
-            await ctx.send(f"⏭️ Jumping to **{target_song['title']}** (moved to top of queue).")
-            ctx.voice_client.stop()
+            await ctx.send(f"⏭️ Jumping to **{target_song.title}** (moved to top of queue).")
+            # Bypasses the repeat filter: the user asked for a specific song
+            player.last_skip = time.monotonic()
+            await player.actor.submit(self.skip_current, player, ctx.voice_client, key='skip')
         else:
-            ctx.voice_client.stop()
+            pending = self.request_skip(self.get_player(ctx.guild.id), ctx.voice_client)
+            if pending is None:
+                return # Repeat of a skip that was just requested
+            await pending
             await ctx.send("⏭️ Skipped song.")
 
+    @commands.command(name='remove', aliases=['rm'])
+    @ensure_voice()
+    async def remove(self, ctx, index: int):
+        """Removes the song at a queue position."""
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.queue:
+            return await ctx.send("Queue is empty.")
+        queue = player.queue
+        if index < 1 or index > len(queue):
+            return await ctx.send(f"Invalid index. Please provide a number between 1 and {len(queue)}.")
+
+        removed = queue.pop(index-1)
+        if index == 1:
+            self.schedule_prefetch(player)
+        await ctx.send(f"🗑️ Removed **{removed.title}** from the queue.")
+
+    @commands.command(name='move', aliases=['mv'])
+    @ensure_voice()
+    async def move(self, ctx, source: int, target: int):
+        """Moves a song to another queue position."""
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.queue:
+            return await ctx.send("Queue is empty.")
+        queue = player.queue
+        if not (1 <= source <= len(queue) and 1 <= target <= len(queue)):
+            return await ctx.send(f"Invalid index. Please provide numbers between 1 and {len(queue)}.")
+
+        moved = queue.move(source-1, target-1)
+        if 1 in (source, target):
+            self.schedule_prefetch(player)
+        await ctx.send(f"↕️ Moved **{moved.title}** to position **{target}**.")
+
+    @commands.command(name='shuffle', aliases=['sh'])
+    @ensure_voice()
+    async def shuffle(self, ctx):
+        """Shuffles the queue."""
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.queue:
+            return await ctx.send("Queue is empty.")
+        queue = player.queue
+
+        queue.shuffle()
+        self.schedule_prefetch(player)
+        await ctx.send(f"🔀 Shuffled **{len(queue)}** songs.")
+
     @commands.command(name='volume', aliases=['v', 'vol'])
     async def volume(self, ctx, volume: int):
         """Sets the volume of the player (0-100)"""
@@ -463,35 +1255,78 @@ class Music(commands.Cog):
         if volume < 0 or volume > 100:
             return await ctx.send("Volume must be between 0 and 100.")
 
-        self.volumes[ctx.guild.id] = volume / 100
+        player = self.get_player(ctx.guild.id)
+        player.volume = volume / 100
         
-        if ctx.voice_client.source:
-            if hasattr(ctx.voice_client.source, 'volume'):
-                ctx.voice_client.source.volume = volume / 100
+        source = ctx.voice_client.source
+        if isinstance(source, PrebufferedSource):
+            source = source.source
+        if source:
+            if hasattr(source, 'volume'):
+                source.volume = volume / 100
+                self.schedule_gapless(player)
+            elif player.current:
+                # Opus mode: restart ffmpeg with the new volume filter at the current position.
+                # Changes still waiting are merged; the restart reads the latest volume.
+                await player.actor.submit(self.restart_source, ctx.voice_client, player, key='volume')
         
         await ctx.send(f"🔊 Volume set to **{volume}%**")
 
+    @commands.command(name='seek')
+    @ensure_voice()
+    async def seek(self, ctx, *, timestamp):
+        """Jumps to a position in the current song (e.g. 90, 1:30, 1:02:03)."""
+        player = self.players.get(ctx.guild.id)
+        if not ctx.voice_client or not player or not player.current:
+            return await ctx.send("Nothing is currently playing.")
+
+        position = parse_timestamp(timestamp)
+        if position is None:
+            return await ctx.send("Invalid time. Use seconds or `m:ss` (e.g. `1:30`).")
+        duration = player.current.duration
+        if duration and position >= duration:
+            return await ctx.send(f"The song is only **{datetime.timedelta(seconds=int(duration))}** long.")
+
+        # Only ffmpeg restarts; the stream URL comes from the extraction cache
+        await player.actor.submit(self.restart_source, ctx.voice_client, player, position)
+        await ctx.send(f"⏩ Seeked to **{datetime.timedelta(seconds=position)}**")
+
+    @commands.command(name='filter', aliases=['fx'])
+    @ensure_voice()
+    async def audio_filter(self, ctx, name: str = None):
+        """Applies an audio effect (bassboost, nightcore, speed) or turns it off."""
+        available = ", ".join(f"`{key}`" for key in FILTERS)
+        if name is None:
+            player = self.players.get(ctx.guild.id)
+            current = player.filter if player and player.filter else "off"
+            return await ctx.send(f"🎚️ Current filter: **{current}**. Available: {available}, `off`")
+
+        name = name.lower()
+        if name != 'off' and name not in FILTERS:
+            return await ctx.send(f"Unknown filter. Available: {available}, `off`")
+        if not ctx.voice_client:
+            return await ctx.send("Not connected to a voice channel.")
+
+        player = self.get_player(ctx.guild.id)
+        await player.actor.submit(self.apply_filter, player, ctx.voice_client, name)
+
+        await ctx.send("🎚️ Filter disabled" if name == 'off' else f"🎚️ Filter set to **{name}**")
+
     @commands.command(name='nowplaying', aliases=['np', 'current'])
     @ensure_voice()
     async def now_playing(self, ctx):
         """Shows the currently playing song with progress bar"""
-        guild_id = ctx.guild.id
+        player = self.players.get(ctx.guild.id)
         
-        if guild_id not in self.current_song or not self.current_song[guild_id]:
+        if not player or not player.current:
             return await ctx.send("Nothing is currently playing.")
             
-        entry = self.current_song[guild_id]
+        entry = player.current
         
-        # Calculate progress
-        current_time = 0
-        if guild_id in self.start_times:
-            if guild_id in self.pause_starts:
-                 # If currently paused, use time up to pause
-                 current_time = self.pause_starts[guild_id] - self.start_times[guild_id]
-            else:
-                 current_time = time.time() - self.start_times[guild_id]
+        # Calculate progress (stops counting while paused)
+        current_time = player.elapsed()
         
-        duration = entry.get('duration', 0)
+        duration = entry.duration or 0
         
         # Create Bar
         # [▬▬▬▬▬▬▬▬▬🔘▬▬▬▬▬▬▬▬]
@@ -510,14 +1345,14 @@ class Music(commands.Cog):
             current_str = str(datetime.timedelta(seconds=int(current_time)))
             time_str = f"{current_str} / Live"
             
-        embed = discord.Embed(title="Now Playing 🎵", description=f"[{entry['title']}]({entry.get('url', '')})", color=discord.Color.blue())
+        embed = discord.Embed(title="Now Playing 🎵", description=f"[{entry.title}]({entry.url})", color=discord.Color.blue())
         
-        if entry.get('thumbnail'):
-            embed.set_thumbnail(url=entry['thumbnail'])
+        if entry.thumbnail:
+            embed.set_thumbnail(url=entry.thumbnail)
             
         embed.add_field(name="Progress", value=f"`{time_str}`\n`{bar}`", inline=False)
         
-        requester = ctx.guild.get_member(entry.get('requester_id'))
+        requester = ctx.guild.get_member(entry.requester_id)
         req_name = requester.display_name if requester else "Unknown"
         embed.set_footer(text=f"Requested by {req_name}", icon_url=requester.display_avatar.url if requester else None)
         
@@ -536,18 +1371,22 @@ class MusicPlayerView(discord.ui.View):
              await interaction.response.send_message("Nothing is playing!", ephemeral=True)
              return
         
+        player = self.cog.get_player(self.ctx.guild.id)
         if vc.is_paused():
             vc.resume()
+            player.resume()
             await interaction.response.send_message("▶️ Resumed", ephemeral=True)
         else:
             vc.pause()
+            player.pause_start = time.time()
             await interaction.response.send_message("⏸️ Paused", ephemeral=True)
 
     @discord.ui.button(label="⏭️ Skip", style=discord.ButtonStyle.secondary, custom_id="music_skip")
     async def skip_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         vc = self.ctx.guild.voice_client
         if vc and (vc.is_playing() or vc.is_paused()):
-            vc.stop()
+            # Not awaited: the interaction must be answered within 3 seconds
+            self.cog.request_skip(self.cog.get_player(self.ctx.guild.id), vc)
             await interaction.response.send_message("⏭️ Skipped", ephemeral=True)
         else:
             await interaction.response.send_message("Nothing to skip", ephemeral=True)
@@ -555,9 +1394,12 @@ class MusicPlayerView(discord.ui.View):
     @discord.ui.button(label="🔁 Loop", style=discord.ButtonStyle.success, custom_id="music_loop")
     async def loop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Toggle Loop
-        current_state = self.cog.loops.get(self.ctx.guild.id, 0)
-        new_state = (current_state + 1) % 3
-        self.cog.loops[self.ctx.guild.id] = new_state
+        if not self.ctx.guild.voice_client:
+            await interaction.response.send_message("Not connected", ephemeral=True)
+            return
+        player = self.cog.get_player(self.ctx.guild.id)
+        new_state = (player.loop + 1) % 3
+        player.loop = new_state
         
         msg = "Loop disabled ➡️"
         if new_state == 1:
@@ -572,20 +1414,19 @@ class MusicPlayerView(discord.ui.View):
     async def stop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         vc = self.ctx.guild.voice_client
         if vc:
-            vc.stop()
-            self.cog.queues[self.ctx.guild.id] = []
-            self.cog.current_song[self.ctx.guild.id] = None
-            self.cog.loops[self.ctx.guild.id] = 0
+            player = self.cog.get_player(self.ctx.guild.id)
+            player.actor.submit(self.cog.stop_playback, player, vc, key='stop')
             await interaction.response.send_message("⏹️ Stopped and queue cleared", ephemeral=True)
         else:
             await interaction.response.send_message("Not connected", ephemeral=True)
 
     @discord.ui.button(label="📜 Queue", style=discord.ButtonStyle.secondary, custom_id="music_queue")
     async def queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.ctx.guild.id in self.cog.queues and self.cog.queues[self.ctx.guild.id]:
-            queue_list = self.cog.queues[self.ctx.guild.id]
+        player = self.cog.players.get(self.ctx.guild.id)
+        if player and player.queue:
+            queue_list = player.queue
             max_lines = 10
-            queue_str = "\n".join([f"{i+1}. {entry['title']}" for i, entry in enumerate(queue_list[:max_lines])])
+            queue_str = "\n".join([f"{i+1}. {entry.title}" for i, entry in enumerate(queue_list.islice(0, max_lines))])
             if len(queue_list) > max_lines:
                 queue_str += f"\n... and {len(queue_list) - max_lines} more."
             await interaction.response.send_message(f"**Current Queue ({len(queue_list)} songs):**\n{queue_str}", ephemeral=True)
@@ -596,10 +1437,11 @@ async def setup(bot):
     await bot.add_cog(Music(bot))
 
 class QueuePaginationView(discord.ui.View):
-    def __init__(self, ctx, queue_list):
+    def __init__(self, ctx, queue_list, pending=0):
         super().__init__(timeout=60)
         self.ctx = ctx
         self.queue_list = queue_list
+        self.pending = pending
         self.current_page = 0
         self.items_per_page = 10
         self.total_pages = (len(queue_list) - 1) // self.items_per_page + 1
@@ -611,12 +1453,15 @@ class QueuePaginationView(discord.ui.View):
     def get_embed(self):
         start = self.current_page * self.items_per_page
         end = start + self.items_per_page
-        current_items = self.queue_list[start:end]
+        current_items = self.queue_list.islice(start, end)
         
-        queue_str = "\n".join([f"{start + i + 1}. {entry['title']}" for i, entry in enumerate(current_items)])
+        queue_str = "\n".join([f"{start + i + 1}. {entry.title}" for i, entry in enumerate(current_items)])
         
         embed = discord.Embed(title=f"Current Queue ({len(self.queue_list)} songs)", description=queue_str, color=discord.Color.blue())
-        embed.set_footer(text=f"Page {self.current_page + 1}/{self.total_pages}")
+        footer = f"Page {self.current_page + 1}/{self.total_pages}"
+        if self.pending:
+            footer += f" • {self.pending} more playlist songs load as the queue plays"
+        embed.set_footer(text=footer)
         return embed
 
     @discord.ui.button(label="◀️", style=discord.ButtonStyle.primary)
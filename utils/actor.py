@@ -0,0 +1,62 @@
+import asyncio
+from collections import deque
+
+class Actor:
+    """
+    Runs submitted coroutine functions one at a time, in submission order.
+    Everything that changes a guild's playback goes through its actor, so those
+    operations never interleave at an await and need no locks. The worker task
+    only exists while there is work, so idle guilds cost nothing.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.mailbox = deque() # (key, coroutine function, args, future)
+        self.task = None
+        self.stats = {'ops': 0, 'coalesced': 0}
+
+    def submit(self, fn, *args, key=None):
+        """
+        Queues fn(*args) and returns a future with its result.
+        If an operation with the same key is still waiting, that one's future is returned instead.
+        """
+        if key is not None:
+            for pending_key, _, _, future in self.mailbox:
+                if pending_key == key:
+                    self.stats['coalesced'] += 1
+                    return future
+
+        future = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never look at the result; don't warn about it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.mailbox.append((key, fn, args, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        while self.mailbox:
+            key, fn, args, future = self.mailbox.popleft()
+            if future.cancelled():
+                continue
+            self.stats['ops'] += 1
+            try:
+                result = await fn(*args)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                print(f"[{self.name}] {fn.__name__} failed: {e}")
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    def close(self):
+        """Drops queued operations and cancels the running one."""
+        for _, _, _, future in self.mailbox:
+            future.cancel()
+        self.mailbox.clear()
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
@@ -0,0 +1,188 @@
+import aiosqlite
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+
+from utils.extraction_cache import canonical_key
+
+# Disk cache settings (opt-in)
+AUDIO_CACHE_ENABLED = os.getenv('AUDIO_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', 2048)) # Total size budget
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', 3)) # Plays before a track is stored
+AUDIO_CACHE_DOWNLOADS = 2 # Parallel background downloads
+DOWNLOAD_TIMEOUT = 600
+
+class AudioCache:
+    """
+    Keeps the Opus audio of frequently played tracks on disk.
+    Downloads run in the background with ffmpeg and never block playback;
+    files are evicted least-recently-played first once the byte budget is exceeded.
+    With a governor, download processes count toward its ffmpeg limit and downloads
+    are put off while it is saturated (the next play of the track tries again).
+    """
+    def __init__(self, db_path, directory, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024, min_plays=AUDIO_CACHE_MIN_PLAYS, governor=None):
+        self.db_path = db_path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.governor = governor
+        self.db = None
+        self.files = OrderedDict() # {key: (path, size)}, most recently played last
+        self.total_bytes = 0
+        self.downloads = {} # {key: asyncio.Task}
+        self.download_slots = asyncio.Semaphore(AUDIO_CACHE_DOWNLOADS)
+        self.stats = {'hits': 0, 'misses': 0, 'downloads': 0, 'failed': 0, 'deferred': 0, 'evictions': 0}
+
+    async def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS audio_cache (
+                key TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                last_access INTEGER
+            )
+        ''')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS play_counts (
+                key TEXT PRIMARY KEY,
+                plays INTEGER DEFAULT 0
+            )
+        ''')
+        await self.db.commit()
+
+        # Load the index, dropping rows whose file disappeared
+        missing = []
+        cursor = await self.db.execute('SELECT key, path, size FROM audio_cache ORDER BY last_access ASC')
+        for key, path, size in await cursor.fetchall():
+            if os.path.exists(path):
+                self.files[key] = (path, size)
+                self.total_bytes += size
+            else:
+                missing.append((key,))
+        if missing:
+            await self.db.executemany('DELETE FROM audio_cache WHERE key = ?', missing)
+            await self.db.commit()
+
+    async def close(self):
+        for task in self.downloads.values():
+            task.cancel()
+        self.downloads = {}
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    def path_for(self, url):
+        """Returns the local file for a track, or None."""
+        found = self.files.get(canonical_key(url))
+        if found and os.path.exists(found[0]):
+            return found[0]
+        return None
+
+    async def record_play(self, url, stream):
+        """
+        Counts a play. Local plays refresh the file's LRU position; streamed plays
+        start a background download once the track is popular enough.
+        """
+        key = canonical_key(url)
+        if not key:
+            return
+        now = int(time.time())
+
+        if stream.get('local'):
+            self.stats['hits'] += 1
+            if key in self.files:
+                self.files.move_to_end(key)
+                await self.db.execute('UPDATE audio_cache SET last_access = ? WHERE key = ?', (now, key))
+                await self.db.commit()
+            return
+
+        self.stats['misses'] += 1
+        if key in self.files or key in self.downloads:
+            return
+        await self.db.execute('''
+            INSERT INTO play_counts (key, plays) VALUES (?, 1)
+            ON CONFLICT(key) DO UPDATE SET plays = plays + 1
+        ''', (key,))
+        await self.db.commit()
+        cursor = await self.db.execute('SELECT plays FROM play_counts WHERE key = ?', (key,))
+        (plays,) = await cursor.fetchone()
+
+        if plays >= self.min_plays:
+            task = asyncio.create_task(self._download(key, stream))
+            self.downloads[key] = task
+            task.add_done_callback(lambda _: self.downloads.pop(key, None))
+
+    async def _download(self, key, stream):
+        filename = re.sub(r'[^A-Za-z0-9_-]', '_', key) + '.opus'
+        path = os.path.join(self.directory, filename)
+        tmp_path = path + '.part'
+        # Opus sources are copied as-is, anything else is encoded once
+        codec = ['-c:a', 'copy'] if stream.get('acodec') == 'opus' else ['-c:a', 'libopus', '-b:a', '128k']
+
+        async with self.download_slots:
+            if self.governor and self.governor.saturated():
+                # Players come first; a later play starts the download again
+                self.stats['deferred'] += 1
+                return
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', stream['stream_url'], '-vn', *codec, '-f', 'ogg', tmp_path,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+                )
+            except OSError as e:
+                print(f"Audio cache download failed for {key}: {e}")
+                self.stats['failed'] += 1
+                return
+            if self.governor:
+                self.governor.track_process(process)
+            code = -1
+            try:
+                code = await asyncio.wait_for(process.wait(), DOWNLOAD_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            finally:
+                if code != 0 and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        if code != 0:
+            self.stats['failed'] += 1
+            return
+
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        self.files[key] = (path, size)
+        self.total_bytes += size
+        self.stats['downloads'] += 1
+        await self.db.execute('INSERT OR REPLACE INTO audio_cache (key, path, size, last_access) VALUES (?, ?, ?, ?)',
+                              (key, path, size, int(time.time())))
+        await self.db.commit()
+        await self.evict()
+
+    async def evict(self):
+        removed = []
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            key, (path, size) = self.files.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            removed.append((key,))
+        if removed:
+            self.stats['evictions'] += len(removed)
+            await self.db.executemany('DELETE FROM audio_cache WHERE key = ?', removed)
+            await self.db.commit()
+
+    def hit_rate(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
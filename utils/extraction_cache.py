@@ -0,0 +1,249 @@
+import aiosqlite
+import os
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+# Cache settings
+EXTRACT_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACT_CACHE_MAX_ENTRIES', 50000)) # Rows kept in SQLite
+EXTRACT_CACHE_MEMORY_ENTRIES = int(os.getenv('EXTRACT_CACHE_MEMORY_ENTRIES', 2000)) # Hot rows kept in memory
+STREAM_URL_MARGIN = 60 # Treat stream URLs expiring within this many seconds as expired
+STREAM_URL_DEFAULT_TTL = 300 # Assumed lifetime for stream URLs without an expire= parameter
+EVICT_EVERY = 100 # Check the row limit every N writes
+DEAD_VIDEO_TTL_DAYS = int(os.getenv('DEAD_VIDEO_TTL_DAYS', 7)) # Days a deleted/blocked video is skipped without retrying
+
+YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)([A-Za-z0-9_-]{11})'
+)
+
+def canonical_key(url):
+    """Maps the different URL shapes of one video to a single cache key."""
+    if not url:
+        return None
+    match = YOUTUBE_ID_RE.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    return url.strip()
+
+def stream_expiry(stream_url, resolved_at=None):
+    """Returns the unix timestamp a resolved stream URL stops working."""
+    try:
+        expire = parse_qs(urlparse(stream_url).query).get('expire')
+        if expire:
+            return int(expire[0])
+    except (ValueError, TypeError):
+        pass
+    return (resolved_at or time.time()) + STREAM_URL_DEFAULT_TTL
+
+def is_fresh(expires_at):
+    return bool(expires_at) and expires_at - time.time() > STREAM_URL_MARGIN
+
+class ExtractionCache:
+    """
+    Read-through cache for yt-dlp results, stored in SQLite.
+    Metadata (title, duration, thumbnail, webpage_url) never expires.
+    Stream URLs are kept until their expire= timestamp.
+    """
+    def __init__(self, db_path, max_entries=EXTRACT_CACHE_MAX_ENTRIES, memory_entries=EXTRACT_CACHE_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.db = None
+        self.memory = OrderedDict() # {key: row dict}, most recently used last
+        self.writes = 0
+        self.dead = {} # {key: marked_at} of videos that failed permanently
+        self.touched = {} # {key: last access} of memory hits not written to SQLite yet
+        self.stats = {'hits': 0, 'misses': 0, 'stream_hits': 0, 'stream_misses': 0, 'evictions': 0}
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS extract_cache (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                duration INTEGER,
+                thumbnail TEXT,
+                webpage_url TEXT,
+                stream_url TEXT,
+                stream_expires INTEGER DEFAULT 0,
+                last_access INTEGER
+            )
+        ''')
+        try:
+            # Codec of the stream, so Opus streams can be passed through without re-encoding
+            await self.db.execute('ALTER TABLE extract_cache ADD COLUMN acodec TEXT')
+        except Exception:
+            pass
+        await self.db.execute('CREATE INDEX IF NOT EXISTS idx_extract_cache_access ON extract_cache (last_access)')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS dead_videos (
+                key TEXT PRIMARY KEY,
+                reason TEXT,
+                marked_at INTEGER
+            )
+        ''')
+        cutoff = int(time.time()) - DEAD_VIDEO_TTL_DAYS * 86400
+        await self.db.execute('DELETE FROM dead_videos WHERE marked_at < ?', (cutoff,))
+        cursor = await self.db.execute('SELECT key, marked_at FROM dead_videos')
+        self.dead = dict(await cursor.fetchall())
+        # Drop stream URLs that expired while the bot was offline
+        await self.db.execute('UPDATE extract_cache SET stream_url = NULL, stream_expires = 0 WHERE stream_expires < ?', (int(time.time()),))
+        await self.db.commit()
+
+    async def close(self):
+        if self.db:
+            await self.write_touched()
+            await self.db.commit()
+            await self.db.close()
+            self.db = None
+
+    def is_dead(self, url):
+        """True if the video was recently found deleted, private or blocked (memory only)."""
+        marked_at = self.dead.get(canonical_key(url))
+        return marked_at is not None and time.time() - marked_at < DEAD_VIDEO_TTL_DAYS * 86400
+
+    async def mark_dead(self, url, reason):
+        key = canonical_key(url)
+        if not key:
+            return
+        now = int(time.time())
+        self.dead[key] = now
+        await self.db.execute('INSERT OR REPLACE INTO dead_videos (key, reason, marked_at) VALUES (?, ?, ?)', (key, reason[:200], now))
+        await self.db.commit()
+
+    def _remember(self, key, row):
+        self.memory[key] = row
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    async def get(self, url):
+        """
+        Returns the cached row for a URL or None.
+        The row always has metadata; 'stream_url' is None when the cached one has expired.
+        """
+        key = canonical_key(url)
+        if not key:
+            return None
+
+        row = self.memory.get(key)
+        if row is not None:
+            self.memory.move_to_end(key)
+            # Under the row's stored key, which differs when key is an alias URL shape
+            self.touched[canonical_key(row['webpage_url']) or key] = int(time.time())
+        elif self.db:
+            cursor = await self.db.execute(
+                'SELECT title, duration, thumbnail, webpage_url, stream_url, stream_expires, acodec FROM extract_cache WHERE key = ?', (key,))
+            found = await cursor.fetchone()
+            if found:
+                title, duration, thumbnail, webpage_url, stream_url, stream_expires, acodec = found
+                row = {
+                    'title': title,
+                    'duration': duration,
+                    'thumbnail': thumbnail,
+                    'webpage_url': webpage_url,
+                    'stream_url': stream_url,
+                    'stream_expires': stream_expires or 0,
+                    'acodec': acodec,
+                }
+                self._remember(key, row)
+                await self.db.execute('UPDATE extract_cache SET last_access = ? WHERE key = ?', (int(time.time()), key))
+
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        result = dict(row)
+        if row['stream_url'] and is_fresh(row['stream_expires']):
+            self.stats['stream_hits'] += 1
+        else:
+            self.stats['stream_misses'] += 1
+            result['stream_url'] = None
+            result['stream_expires'] = 0
+        return result
+
+    def has_fresh_stream(self, url):
+        """Memory-only check (no stats, no DB) used to skip needless prefetches."""
+        row = self.memory.get(canonical_key(url))
+        return bool(row and row['stream_url'] and is_fresh(row['stream_expires']))
+
+    async def put(self, url, data):
+        """
+        Stores a full (non-flat) yt-dlp info dict under the canonical key of the URL.
+        Returns the stored row, or None for flat entries which carry no stream URL.
+        """
+        key = canonical_key(data.get('webpage_url') or url)
+        if not key or 'format_id' not in data:
+            return None
+        stream_url = data.get('url')
+        row = {
+            'title': data.get('title'),
+            'duration': data.get('duration'),
+            'thumbnail': data.get('thumbnail'),
+            'webpage_url': data.get('webpage_url') or url,
+            'stream_url': stream_url,
+            'stream_expires': stream_expiry(stream_url) if stream_url else 0,
+            'acodec': data.get('acodec'),
+        }
+        self._remember(key, row)
+        # Also remember the requested URL shape if it maps to a different key
+        url_key = canonical_key(url)
+        if url_key and url_key != key:
+            self._remember(url_key, row)
+
+        if self.db:
+            await self._write(key, row)
+        return dict(row)
+
+    async def _write(self, key, row):
+        await self.db.execute('''
+            INSERT INTO extract_cache (key, title, duration, thumbnail, webpage_url, stream_url, stream_expires, acodec, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                title = excluded.title,
+                duration = excluded.duration,
+                thumbnail = excluded.thumbnail,
+                webpage_url = excluded.webpage_url,
+                stream_url = excluded.stream_url,
+                stream_expires = excluded.stream_expires,
+                acodec = excluded.acodec,
+                last_access = excluded.last_access
+        ''', (key, row['title'], row['duration'], row['thumbnail'], row['webpage_url'], row['stream_url'], row['stream_expires'], row['acodec'], int(time.time())))
+        await self.db.commit()
+
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            await self.evict()
+
+    async def write_touched(self):
+        """Writes last_access for memory hits in one batch; they are only needed once evict runs."""
+        if not self.touched:
+            return
+        touched, self.touched = self.touched, {}
+        await self.db.executemany('UPDATE extract_cache SET last_access = ? WHERE key = ?',
+                                  [(accessed, key) for key, accessed in touched.items()])
+        await self.db.commit()
+
+    async def evict(self):
+        """Removes the least recently used rows beyond max_entries."""
+        # Hot rows are served from memory; record their use before picking rows to drop
+        await self.write_touched()
+        cursor = await self.db.execute('SELECT COUNT(*) FROM extract_cache')
+        (count,) = await cursor.fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        await self.db.execute('''
+            DELETE FROM extract_cache WHERE key IN (
+                SELECT key FROM extract_cache ORDER BY last_access ASC LIMIT ?
+            )
+        ''', (excess,))
+        await self.db.commit()
+        self.stats['evictions'] += excess
+
+    def hit_rate(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
@@ -0,0 +1,219 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+import yt_dlp
+
+# Extraction pool settings
+EXTRACTOR_MODE = os.getenv('EXTRACTOR_MODE', 'thread') # 'thread' or 'process'
+EXTRACTOR_WORKERS = int(os.getenv('EXTRACTOR_WORKERS', 8))
+EXTRACTOR_TIMEOUT = float(os.getenv('EXTRACTOR_TIMEOUT', 30)) # Seconds a caller waits; only process mode can kill the job
+EXTRACTOR_MAX_JOBS = int(os.getenv('EXTRACTOR_MAX_JOBS', 200)) # Recycle a worker's YoutubeDL after N jobs
+
+# Fields of an info dict we never use; dropped before results leave the worker
+HEAVY_FIELDS = ('formats', 'requested_formats', 'thumbnails', 'automatic_captions', 'subtitles', 'heatmap', 'chapters', 'description')
+
+# Worker state: one per thread in thread mode, one per process in process mode
+_worker = threading.local()
+
+def _init_worker(options, max_jobs):
+    _worker.options = options
+    _worker.max_jobs = max_jobs
+    _worker.ytdl = None
+    _worker.jobs = 0
+
+def _slim(info):
+    for field in HEAVY_FIELDS:
+        info.pop(field, None)
+    if info.get('entries'):
+        info['entries'] = [_slim(entry) for entry in info['entries'] if entry]
+    return info
+
+def _extract(query, overrides=None):
+    if overrides:
+        # One-off options (e.g. playlist_items) get their own short-lived instance
+        with yt_dlp.YoutubeDL({**_worker.options, **overrides}) as ytdl:
+            return _slim(ytdl.sanitize_info(ytdl.extract_info(query, download=False)))
+
+    if _worker.ytdl is None or _worker.jobs >= _worker.max_jobs:
+        # Fresh instance bounds the memory yt-dlp's internal caches can grow to
+        if _worker.ytdl is not None:
+            _worker.ytdl.close()
+        _worker.ytdl = yt_dlp.YoutubeDL(_worker.options)
+        _worker.jobs = 0
+    _worker.jobs += 1
+    info = _worker.ytdl.extract_info(query, download=False)
+    # sanitize_info makes the result plain (picklable) data for process mode
+    return _slim(_worker.ytdl.sanitize_info(info))
+
+class PlaylistCursor:
+    """
+    A playlist's entries read lazily from one yt-dlp extraction, page by page.
+    Each page continues where the previous one stopped instead of walking the
+    playlist's continuation pages again from the start.
+    """
+    def __init__(self, ytdl, entries, total=None):
+        self.ytdl = ytdl
+        self.entries = entries
+        self.total = total
+
+    def next_page(self, size):
+        """Returns (entries read, usable entries). Blocking, runs on the pool."""
+        raw = list(islice(self.entries, size))
+        page = []
+        for entry in raw:
+            if not entry:
+                continue
+            entry = self.ytdl.sanitize_info(entry)
+            if not entry.get('thumbnail') and entry.get('thumbnails'):
+                # Unprocessed entries only carry the thumbnails list
+                entry['thumbnail'] = entry['thumbnails'][-1].get('url')
+            page.append(_slim(entry))
+        return len(raw), page
+
+    def close(self):
+        self.ytdl.close()
+
+def _open_playlist(url, options, start):
+    ytdl = yt_dlp.YoutubeDL(options)
+    try:
+        # process=False keeps 'entries' as yt-dlp's generator, which fetches continuations on demand
+        info = ytdl.extract_info(url, download=False, process=False)
+        for _ in range(3):
+            # e.g. watch?v=...&list=... points at the playlist page
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ytdl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        entries = iter(info.get('entries') or ())
+        # Skip what earlier pages already queued
+        for _ in islice(entries, start - 1):
+            pass
+    except Exception:
+        ytdl.close()
+        raise
+    return PlaylistCursor(ytdl, entries, info.get('playlist_count'))
+
+class Extractor:
+    """
+    Runs yt-dlp extraction on a dedicated pool, each worker with its own YoutubeDL.
+    Process mode keeps yt-dlp's CPU-heavy parsing off the GIL the voice threads need.
+    On a timeout, process mode kills the pool's workers and starts a new pool. Threads can't be
+    stopped, so in thread mode the caller gets the timeout but the job keeps its worker until
+    yt-dlp returns; a few hung calls can occupy the whole pool.
+    """
+    def __init__(self, options, mode=EXTRACTOR_MODE, workers=EXTRACTOR_WORKERS, timeout=EXTRACTOR_TIMEOUT, max_jobs=EXTRACTOR_MAX_JOBS):
+        self.options = dict(options)
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.stats = {'jobs': 0, 'timeouts': 0, 'errors': 0, 'restarts': 0}
+        self.pool_jobs = 0
+        self.active = 0 # Extractions submitted and not finished yet
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        self.pool_jobs = 0
+        if self.mode == 'process':
+            # Not using max_tasks_per_child: it can deadlock the pool on Python 3.11.
+            # The whole pool is recycled in extract() instead.
+            # spawn: forking a process that runs voice threads can copy held locks
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.options, self.max_jobs),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='ytdl',
+            initializer=_init_worker,
+            initargs=(self.options, self.max_jobs),
+        )
+
+    async def extract(self, query, **overrides):
+        """Equivalent of ytdl.extract_info(query, download=False), with a timeout."""
+        self.stats['jobs'] += 1
+        if self.mode == 'process' and self.pool_jobs >= self.workers * self.max_jobs:
+            # Fresh processes release everything the old ones accumulated
+            self.restart(cancel=False)
+        self.pool_jobs += 1
+        return await self._run(_extract, query, overrides or None)
+
+    async def open_playlist(self, url, start=1):
+        """Starts a lazy read of a playlist at entry start (1-based). None in process mode."""
+        if self.mode == 'process':
+            # The entry generator can't be sent between processes
+            return None
+        self.stats['jobs'] += 1
+        return await self._run(_open_playlist, url, self.options, start)
+
+    async def playlist_page(self, cursor, size):
+        """Reads the next size entries of an open playlist: (entries read, usable entries)."""
+        self.stats['jobs'] += 1
+        return await self._run(cursor.next_page, size)
+
+    async def _run(self, fn, *args):
+        self.active += 1
+        executor = self.executor
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._job_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            if self.mode == 'process' and executor is self.executor:
+                # The hung call would hold its process forever; other jobs on that pool fail and can be retried
+                self.restart(cancel=True, terminate=True)
+            raise TimeoutError(f"Extraction timed out after {self.timeout:.0f}s")
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault, or killed above): start a new pool unless that already happened
+            self.stats['errors'] += 1
+            if executor is self.executor:
+                self.restart(cancel=True)
+            raise
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+
+    def _job_done(self, future):
+        # Runs in the worker thread; the counter is only read for display
+        self.active -= 1
+
+    def restart(self, cancel=True, terminate=False):
+        """
+        Swaps in a new pool. The old one finishes its running jobs unless cancel is set
+        (queued jobs are dropped) or terminate is set (process mode: its workers are killed).
+        """
+        old = self.executor
+        self.executor = self._create_executor()
+        self.stats['restarts'] += 1
+        # ProcessPoolExecutor has no public way to stop a running job
+        processes = list((getattr(old, '_processes', None) or {}).values()) if terminate else []
+        old.shutdown(wait=False, cancel_futures=cancel)
+        for process in processes:
+            process.terminate()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one pending call."""
+    def __init__(self):
+        self.inflight = {} # {key: asyncio.Future}
+        self.stats = {'calls': 0, 'coalesced': 0}
+
+    async def do(self, key, factory):
+        self.stats['calls'] += 1
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            future = asyncio.ensure_future(factory())
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # shield: one caller giving up (e.g. !stop) must not cancel the others
+        return await asyncio.shield(future)
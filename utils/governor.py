@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+# Governor settings
+MAX_FFMPEG_PROCESSES = int(os.getenv('MAX_FFMPEG_PROCESSES', (os.cpu_count() or 1) * 50)) # Live ffmpeg processes across all guilds
+MAX_CPU_PERCENT = float(os.getenv('MAX_CPU_PERCENT', 85)) # Machine-wide CPU use above which new players wait
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 20)) # Seconds a new !play waits for capacity before giving up
+SAMPLE_INTERVAL = 5 # Seconds between /proc samples
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _process_usage(pid):
+    """Returns (cpu ticks used, resident bytes) of a process from /proc, or None if it is gone."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the parenthesised command name; utime and stime are fields 14 and 15
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return int(fields[11]) + int(fields[12]), resident_pages * PAGE_SIZE
+
+def _system_ticks():
+    """Returns (busy ticks, total ticks) for the whole machine, or None without /proc."""
+    try:
+        with open('/proc/stat') as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = values[3] + (values[4] if len(values) > 4 else 0) # idle + iowait
+    return sum(values) - idle, sum(values)
+
+def _exited(process):
+    # asyncio processes have no poll(); their returncode is set once the process is reaped
+    if hasattr(process, 'poll'):
+        return process.poll() is not None
+    return process.returncode is not None
+
+class Governor:
+    """
+    Keeps count of the ffmpeg processes the bot is running and samples their CPU and
+    memory use, so new players can be held back when the machine is saturated.
+    """
+    def __init__(self, max_processes=MAX_FFMPEG_PROCESSES, max_cpu=MAX_CPU_PERCENT):
+        self.max_processes = max_processes
+        self.max_cpu = max_cpu
+        self.processes = {} # {pid: subprocess.Popen or asyncio.subprocess.Process}
+        self.usage = {} # {pid: (cpu ticks, rss bytes)} from the last sample
+        self.ffmpeg_cpu = 0.0 # Percent of one core used by all ffmpeg processes
+        self.ffmpeg_rss = 0
+        self.system_cpu = 0.0 # Percent of the whole machine
+        self.stats = {'admitted': 0, 'waited': 0, 'rejected': 0}
+        self.last_system = None
+        self.last_sample = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._sample_loop())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def track(self, source):
+        """Registers the ffmpeg process behind a discord.py audio source."""
+        source = getattr(source, 'original', source) # PCMVolumeTransformer
+        process = getattr(source, '_process', None)
+        if process is not None:
+            self.track_process(process)
+
+    def track_process(self, process):
+        """Registers an ffmpeg process started outside discord.py (e.g. an audio cache download)."""
+        self.processes[process.pid] = process
+
+    def live(self):
+        """Number of ffmpeg processes still running."""
+        for pid in [pid for pid, process in self.processes.items() if _exited(process)]:
+            del self.processes[pid]
+            self.usage.pop(pid, None)
+        return len(self.processes)
+
+    def saturated(self):
+        return self.live() >= self.max_processes or self.system_cpu >= self.max_cpu
+
+    async def admit(self, timeout=ADMISSION_TIMEOUT):
+        """Waits up to timeout seconds for capacity for one more player. Returns False if there was none."""
+        if not self.saturated():
+            self.stats['admitted'] += 1
+            return True
+        self.stats['waited'] += 1
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            if not self.saturated():
+                self.stats['admitted'] += 1
+                return True
+        self.stats['rejected'] += 1
+        return False
+
+    def sample(self):
+        """Updates CPU and RSS figures from /proc."""
+        now = time.monotonic()
+        interval = now - self.last_sample if self.last_sample else None
+        self.last_sample = now
+        self.live()
+
+        cpu_ticks = 0
+        rss = 0
+        usage = {}
+        for pid in self.processes:
+            current = _process_usage(pid)
+            if current is None:
+                continue
+            usage[pid] = current
+            previous = self.usage.get(pid)
+            # New processes start counting from their first sample
+            cpu_ticks += current[0] - (previous[0] if previous else current[0])
+            rss += current[1]
+        self.usage = usage
+        self.ffmpeg_rss = rss
+        if interval:
+            self.ffmpeg_cpu = cpu_ticks / CLOCK_TICKS / interval * 100
+
+        system = _system_ticks()
+        if system and self.last_system:
+            busy = system[0] - self.last_system[0]
+            total = system[1] - self.last_system[1]
+            self.system_cpu = busy / total * 100 if total else 0.0
+        self.last_system = system
+
+    async def _sample_loop(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(SAMPLE_INTERVAL)
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+from utils.actor import Actor
+from utils.track_queue import TrackQueue
+
+# 100 lets Opus streams pass through ffmpeg without re-encoding
+DEFAULT_VOLUME = int(os.getenv('DEFAULT_VOLUME', 50)) / 100
+
+class GuildPlayer:
+    """All playback state for one guild. Created on first use, dropped on leave/disconnect."""
+    __slots__ = (
+        'guild_id',
+        'actor', # Serializes everything that changes playback
+        'queue',
+        'loop', # 0: Off, 1: Current, 2: All
+        'volume',
+        'filter', # Name of the active audio effect, or None
+        'rate', # Playback speed of the active effect (song seconds per real second)
+        'current', # Entry that is playing now
+        'np_msg', # Last "Now playing" message
+        'text_channel_id', # Where playback was started from; used again after a restart
+        'start_time',
+        'pause_start',
+        'prefetch_task',
+        'prefetching', # (entry, task) currently being resolved ahead
+        'resolver_tasks', # Spotify playlists still being resolved
+        'playlist_feeds', # YouTube playlists with pages still to fetch, oldest first
+        'feed_task', # Page fetch in progress
+        'gapless_task', # Timer that prepares the next song's source (gapless mode)
+        'next_source', # (queued entry, resolved entry, stream, prebuffered source) ready to play next
+        'last_skip', # When the last skip was requested (monotonic), to drop repeated clicks
+        'stop_requested', # Set by skip so an early end is not mistaken for a dropped stream
+        'retries', # Stream recoveries attempted for the current song
+        'recovered', # Songs resumed after their stream dropped
+        'recovery_failures', # Songs given up on after retries ran out
+        'failures', # Songs in a row that could not be played (circuit breaker)
+    )
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.actor = Actor(f"guild {guild_id}")
+        self.queue = TrackQueue()
+        self.loop = 0
+        self.volume = DEFAULT_VOLUME
+        self.filter = None
+        self.rate = 1.0
+        self.current = None
+        self.np_msg = None
+        self.text_channel_id = None
+        self.start_time = None
+        self.pause_start = None
+        self.prefetch_task = None
+        self.prefetching = None
+        self.resolver_tasks = set()
+        self.playlist_feeds = deque()
+        self.feed_task = None
+        self.gapless_task = None
+        self.next_source = None
+        self.last_skip = 0
+        self.stop_requested = False
+        self.retries = 0
+        self.recovered = 0
+        self.recovery_failures = 0
+        self.failures = 0
+
+    def elapsed(self):
+        """Position in the current song in seconds, not counting pauses and scaled by the playback rate."""
+        if self.start_time is None:
+            return 0
+        end = self.pause_start or time.time()
+        return (end - self.start_time) * self.rate
+
+    def seek_to(self, position):
+        """Sets the clock so elapsed() reports position from now on."""
+        self.start_time = time.time() - position / self.rate
+
+    def resume(self):
+        """Shifts the start time by the paused duration so elapsed() skips the pause."""
+        if self.pause_start is not None:
+            if self.start_time is not None:
+                self.start_time += time.time() - self.pause_start
+            self.pause_start = None
+
+    def upcoming(self):
+        """The entry play_next will pick when the current song ends, or None."""
+        if self.loop == 1 or (self.loop == 2 and not self.queue):
+            return self.current
+        return self.queue[0] if self.queue else None
+
+    def cancel_prefetch(self):
+        if self.prefetch_task and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        self.prefetch_task = None
+        self.prefetching = None
+
+    def cancel_resolvers(self):
+        for task in self.resolver_tasks:
+            task.cancel()
+        self.resolver_tasks = set()
+
+    def cancel_feeds(self):
+        if self.feed_task and not self.feed_task.done():
+            self.feed_task.cancel()
+        self.feed_task = None
+        for feed in self.playlist_feeds:
+            feed.close()
+        self.playlist_feeds.clear()
+
+    def cancel_gapless(self):
+        """Stops preparing the next song and kills its ffmpeg process if one was started."""
+        if self.gapless_task and not self.gapless_task.done():
+            self.gapless_task.cancel()
+        self.gapless_task = None
+        if self.next_source:
+            self.next_source[3].cleanup()
+            self.next_source = None
+
+    def take_next_source(self, entry):
+        """Returns (resolved entry, stream, source) if the prepared source is for entry, else None."""
+        prepared = self.next_source
+        self.next_source = None
+        self.cancel_gapless()
+        if prepared and prepared[0] is entry:
+            return prepared[1:]
+        if prepared:
+            prepared[3].cleanup()
+        return None
+
+    def reset(self):
+        """Stops background work and clears the queue (!stop)."""
+        self.cancel_prefetch()
+        self.cancel_resolvers()
+        self.cancel_feeds()
+        self.cancel_gapless()
+        self.queue.clear()
+        self.current = None
+        self.loop = 0
+        self.np_msg = None
+
+    def approx_size(self, sample=50):
+        """Rough memory use in bytes: the player, its queue and a sample of entries."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.queue)
+        entries = list(islice(self.queue, sample))
+        if self.current is not None:
+            entries.append(self.current)
+        if entries:
+            per_entry = sum(_deep_size(entry) for entry in entries) / len(entries)
+            size += int(per_entry * (len(self.queue) + (self.current is not None)))
+        return size
+
+def _deep_size(track):
+    return sys.getsizeof(track) + sum(sys.getsizeof(getattr(track, slot)) for slot in track.__slots__)
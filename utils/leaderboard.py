@@ -0,0 +1,193 @@
+import os
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import chain, islice
+
+# Leaderboard cache settings
+LEADERBOARD_CACHE_GUILDS = int(os.getenv('LEADERBOARD_CACHE_GUILDS', 100)) # Guild leaderboards kept in memory
+LEADERBOARD_IDLE_MINUTES = int(os.getenv('LEADERBOARD_IDLE_MINUTES', 30)) # Drop a guild's leaderboard after this long without a lookup
+
+class RankList:
+    """
+    Sorted list with O(log n) rank lookups.
+    Keys live in sorted blocks with a Fenwick tree over the block lengths (the same
+    layout as TrackQueue), so insert, remove and index are O(log n) plus a bounded
+    shift inside one block.
+    """
+    LOAD = 512 # Target block size; blocks are split at twice this
+
+    def __init__(self, keys=()):
+        """keys must already be sorted."""
+        keys = list(keys)
+        self._blocks = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._maxes = [block[-1] for block in self._blocks] # Last key of each block
+        self._len = len(keys)
+        self._rebuild()
+
+    # Fenwick tree helpers
+    def _rebuild(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, block_index, delta):
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block_index):
+        """Number of keys in the blocks before block_index."""
+        total = 0
+        i = block_index
+        while i:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        """Returns (block index, offset in block) of a 0-based position."""
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= index:
+                pos = nxt
+                index -= self._tree[nxt]
+            step >>= 1
+        return pos, index
+
+    def __len__(self):
+        return self._len
+
+    def insert(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._rebuild()
+            return
+        block_index = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[block_index]
+        insort(block, key)
+        self._maxes[block_index] = block[-1]
+        self._len += 1
+        if len(block) > 2 * self.LOAD:
+            self._blocks[block_index:block_index + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            self._maxes[block_index:block_index + 1] = [block[self.LOAD - 1], block[-1]]
+            self._rebuild()
+        else:
+            self._add(block_index, 1)
+
+    def remove(self, key):
+        block_index, offset = self._find(key)
+        block = self._blocks[block_index]
+        del block[offset]
+        self._len -= 1
+        if block:
+            self._maxes[block_index] = block[-1]
+            self._add(block_index, -1)
+        else:
+            del self._blocks[block_index]
+            del self._maxes[block_index]
+            self._rebuild()
+
+    def index(self, key):
+        """0-based position of key."""
+        block_index, offset = self._find(key)
+        return self._prefix(block_index) + offset
+
+    def _find(self, key):
+        block_index = bisect_left(self._maxes, key)
+        if block_index < len(self._blocks):
+            block = self._blocks[block_index]
+            offset = bisect_left(block, key)
+            if offset < len(block) and block[offset] == key:
+                return block_index, offset
+        raise ValueError(f"{key!r} is not in the list")
+
+    def islice(self, start, stop=None):
+        """Iterates keys [start:stop] without copying."""
+        stop = self._len if stop is None else min(stop, self._len)
+        if start >= stop:
+            return iter(())
+        block_index, offset = self._locate(start)
+        first = islice(self._blocks[block_index], offset, None)
+        rest = chain.from_iterable(self._blocks[block_index + 1:])
+        return islice(chain(first, rest), stop - start)
+
+class GuildLeaderboard:
+    """One guild's members ranked by XP, highest first; ties go to the lower user id."""
+    __slots__ = ('xp', 'ranks', 'last_used')
+
+    def __init__(self, xp):
+        self.xp = dict(xp) # {user_id: xp}
+        # Keys sort ascending, so negate XP to put the highest first
+        self.ranks = RankList(sorted((-total, user_id) for user_id, total in self.xp.items()))
+        self.last_used = time.monotonic()
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def add(self, user_id, xp):
+        old = self.xp.get(user_id)
+        if old is not None:
+            if not xp:
+                return
+            self.ranks.remove((-old, user_id))
+        total = self.xp[user_id] = (old or 0) + xp
+        self.ranks.insert((-total, user_id))
+
+    def rank(self, user_id):
+        """1-based rank, or None if the user has no stats here."""
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        return self.ranks.index((-xp, user_id)) + 1
+
+    def page(self, start, count):
+        """[(user_id, xp)] for ranks start+1 .. start+count."""
+        return [(user_id, -negative_xp) for negative_xp, user_id in self.ranks.islice(start, start + count)]
+
+class LeaderboardCache:
+    """
+    Guild leaderboards that have been looked at recently.
+    At most max_guilds are kept (least recently used go first), and guilds
+    nobody has looked at for idle_minutes are dropped by evict_idle.
+    """
+    def __init__(self, max_guilds=LEADERBOARD_CACHE_GUILDS, idle_minutes=LEADERBOARD_IDLE_MINUTES):
+        self.max_guilds = max_guilds
+        self.idle_seconds = idle_minutes * 60
+        self.boards = OrderedDict() # {guild_id: GuildLeaderboard}, most recently used last
+        self.stats = {'loads': 0, 'evictions': 0}
+
+    def get(self, guild_id):
+        """Returns the guild's leaderboard and marks it used, or None if it isn't loaded."""
+        board = self.boards.get(guild_id)
+        if board is not None:
+            self.boards.move_to_end(guild_id)
+            board.last_used = time.monotonic()
+        return board
+
+    def peek(self, guild_id):
+        """Like get, but XP updates don't count as use."""
+        return self.boards.get(guild_id)
+
+    def put(self, guild_id, board):
+        self.boards[guild_id] = board
+        self.boards.move_to_end(guild_id)
+        self.stats['loads'] += 1
+        while len(self.boards) > self.max_guilds:
+            self.boards.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for guild_id in [guild_id for guild_id, board in self.boards.items() if board.last_used < cutoff]:
+            del self.boards[guild_id]
+            self.stats['evictions'] += 1
@@ -0,0 +1,54 @@
+import os
+
+# Playlist paging settings
+PLAYLIST_PAGE_SIZE = int(os.getenv('PLAYLIST_PAGE_SIZE', 100)) # Entries fetched per page
+PLAYLIST_LOW_WATER = 25 # Fetch the next page when fewer songs than this are queued
+PLAYLIST_PAGE_RETRIES = 3 # Attempts per page before the rest of the playlist is given up
+
+class PlaylistFeed:
+    """A YouTube playlist that is queued page by page instead of listed in full up front."""
+    __slots__ = ('url', 'requester_id', 'next_index', 'total', 'added', 'done', 'cursor', 'lazy')
+
+    def __init__(self, url, requester_id):
+        self.url = url
+        self.requester_id = requester_id
+        self.next_index = 1 # yt-dlp playlist_items are 1-based
+        self.total = None # playlist_count once YouTube reports it
+        self.added = 0
+        self.done = False
+        self.cursor = None # Extractor PlaylistCursor continuing from next_index, once opened
+        self.lazy = True # False when the extractor can't keep a cursor (process mode)
+
+    def page_options(self):
+        """yt-dlp overrides that fetch just the next page."""
+        end = self.next_index + PLAYLIST_PAGE_SIZE - 1
+        return {'playlist_items': f"{self.next_index}-{end}"}
+
+    def advance(self, data):
+        """Records a page fetched with page_options() and returns its entries."""
+        entries = data.get('entries') or []
+        return self._add(entries, PLAYLIST_PAGE_SIZE, data.get('playlist_count'), exhausted=not any(entries))
+
+    def advance_lazy(self, entries, read):
+        """Records a page read from the cursor (read entries, including unavailable ones) and returns its entries."""
+        return self._add(entries, read, self.cursor and self.cursor.total, exhausted=read < PLAYLIST_PAGE_SIZE)
+
+    def _add(self, entries, read, total, exhausted):
+        entries = [entry for entry in entries if entry]
+        self.total = total or self.total
+        self.next_index += read
+        self.added += len(entries)
+        if exhausted or (self.total and self.next_index > self.total):
+            self.done = True
+        return entries
+
+    def remaining(self):
+        """Songs not fetched yet, if the total is known."""
+        if self.done or not self.total:
+            return 0
+        return max(0, self.total - self.next_index + 1)
+
+    def close(self):
+        if self.cursor:
+            self.cursor.close()
+            self.cursor = None
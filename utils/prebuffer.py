@@ -0,0 +1,46 @@
+import discord
+from collections import deque
+
+class PrebufferedSource(discord.AudioSource):
+    """
+    Wraps an audio source whose first frames are read ahead of time, so the
+    ffmpeg spawn, connect and initial buffering happen before it is played.
+    The read-ahead is capped at max_bytes.
+    """
+    def __init__(self, source, max_bytes):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.buffered_bytes = 0
+        self.ended = False
+
+    def fill(self, max_frames):
+        """Reads up to max_frames 20 ms frames. Blocking, run it in an executor."""
+        try:
+            while len(self.frames) < max_frames and self.buffered_bytes < self.max_bytes:
+                frame = self.source.read()
+                if not frame:
+                    self.ended = True
+                    break
+                self.frames.append(frame)
+                self.buffered_bytes += len(frame)
+        except Exception:
+            # Source was cleaned up while filling
+            self.ended = True
+
+    def read(self):
+        if self.frames:
+            frame = self.frames.popleft()
+            self.buffered_bytes -= len(frame)
+            return frame
+        if self.ended:
+            return b''
+        return self.source.read()
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.frames.clear()
+        self.buffered_bytes = 0
+        self.source.cleanup()
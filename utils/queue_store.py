@@ -0,0 +1,186 @@
+import aiosqlite
+import os
+import time
+
+from utils.track import Track
+
+# Snapshot settings
+QUEUE_SNAPSHOT_INTERVAL = int(os.getenv('QUEUE_SNAPSHOT_INTERVAL', 10)) # Seconds between snapshots
+
+def _track_row(track):
+    return (track.url, track.title, track.requester_id, track.duration, track.thumbnail)
+
+class QueueStore:
+    """
+    Snapshots every guild's queue, current song and settings to SQLite so they survive a restart.
+    Only changes are written: songs played from the front are deleted and songs added
+    at the end are inserted. Other edits (shuffle, move, remove) rewrite that guild's rows.
+    Playlists still being paged in are saved by position, so the rest is fetched after a restart.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = None
+        self.saved = {} # {guild_id: (list of queued Tracks as saved, seq of the first one)}
+        self.states = {} # {guild_id: last saved player_state values}
+        self.feeds = {} # {guild_id: last saved playlist_feeds rows}
+        self.stats = {'snapshots': 0, 'rows_written': 0, 'rewrites': 0}
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS player_state (
+                guild_id INTEGER PRIMARY KEY,
+                voice_channel_id INTEGER,
+                text_channel_id INTEGER,
+                loop INTEGER,
+                volume REAL,
+                filter TEXT,
+                current_url TEXT,
+                current_title TEXT,
+                current_requester_id INTEGER,
+                current_duration REAL,
+                current_thumbnail TEXT,
+                position REAL,
+                saved_at INTEGER
+            )
+        ''')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS queue_items (
+                guild_id INTEGER,
+                seq INTEGER,
+                url TEXT,
+                title TEXT,
+                requester_id INTEGER,
+                duration REAL,
+                thumbnail TEXT,
+                PRIMARY KEY (guild_id, seq)
+            ) WITHOUT ROWID
+        ''')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS playlist_feeds (
+                guild_id INTEGER,
+                seq INTEGER,
+                url TEXT,
+                next_index INTEGER,
+                requester_id INTEGER,
+                total INTEGER,
+                PRIMARY KEY (guild_id, seq)
+            ) WITHOUT ROWID
+        ''')
+        await self.db.commit()
+
+    async def close(self):
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    async def load(self):
+        """Returns the saved players as dicts with Tracks built from the snapshot (no extraction needed)."""
+        cursor = await self.db.execute('''
+            SELECT guild_id, voice_channel_id, text_channel_id, loop, volume, filter,
+                   current_url, current_title, current_requester_id, current_duration, current_thumbnail, position
+            FROM player_state
+        ''')
+        players = []
+        for row in await cursor.fetchall():
+            guild_id = row[0]
+            cursor = await self.db.execute(
+                'SELECT seq, url, title, requester_id, duration, thumbnail FROM queue_items WHERE guild_id = ? ORDER BY seq', (guild_id,))
+            items = await cursor.fetchall()
+            queue = [Track(url, title, requester_id, duration, thumbnail) for _, url, title, requester_id, duration, thumbnail in items]
+            # The restored queue holds these same objects, so the first snapshot finds nothing to write
+            self.saved[guild_id] = (list(queue), items[0][0] if items else 0)
+            cursor = await self.db.execute(
+                'SELECT url, next_index, requester_id, total FROM playlist_feeds WHERE guild_id = ? ORDER BY seq', (guild_id,))
+            feeds = [tuple(feed) for feed in await cursor.fetchall()]
+            self.feeds[guild_id] = tuple(feeds)
+            players.append({
+                'guild_id': guild_id,
+                'voice_channel_id': row[1],
+                'text_channel_id': row[2],
+                'loop': row[3],
+                'volume': row[4],
+                'filter': row[5],
+                'current': Track(row[6], row[7], row[8], row[9], row[10]) if row[6] else None,
+                'position': row[11] or 0,
+                'queue': queue,
+                'feeds': feeds, # [(url, next_index, requester_id, total)], oldest first
+            })
+        return players
+
+    async def save(self, players):
+        """Writes the changes since the last snapshot. players: {guild_id: (GuildPlayer, voice channel id)}."""
+        for guild_id in [guild_id for guild_id in self.saved if guild_id not in players]:
+            # Player left or was disconnected
+            await self.db.execute('DELETE FROM player_state WHERE guild_id = ?', (guild_id,))
+            await self.db.execute('DELETE FROM queue_items WHERE guild_id = ?', (guild_id,))
+            await self.db.execute('DELETE FROM playlist_feeds WHERE guild_id = ?', (guild_id,))
+            del self.saved[guild_id]
+            self.states.pop(guild_id, None)
+            self.feeds.pop(guild_id, None)
+
+        for guild_id, (player, voice_channel_id) in players.items():
+            await self._save_queue(guild_id, list(player.queue))
+            await self._save_feeds(guild_id, player.playlist_feeds)
+            current = player.current
+            state = (
+                voice_channel_id, player.text_channel_id, player.loop, player.volume, player.filter,
+                *(_track_row(current) if current else (None,) * 5),
+                round(player.elapsed()) if current else 0,
+            )
+            if self.states.get(guild_id) != state:
+                self.states[guild_id] = state
+                await self.db.execute('INSERT OR REPLACE INTO player_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                      (guild_id, *state, int(time.time())))
+                self.stats['rows_written'] += 1
+
+        await self.db.commit()
+        self.stats['snapshots'] += 1
+
+    async def _save_feeds(self, guild_id, playlist_feeds):
+        feeds = tuple((feed.url, feed.next_index, feed.requester_id, feed.total) for feed in playlist_feeds)
+        if self.feeds.get(guild_id, ()) == feeds:
+            return
+        # A guild has a playlist or two at most, so rewriting them is cheap
+        await self.db.execute('DELETE FROM playlist_feeds WHERE guild_id = ?', (guild_id,))
+        if feeds:
+            await self.db.executemany('INSERT INTO playlist_feeds VALUES (?, ?, ?, ?, ?, ?)',
+                                      [(guild_id, seq, *feed) for seq, feed in enumerate(feeds)])
+            self.stats['rows_written'] += len(feeds)
+        self.feeds[guild_id] = feeds
+
+    async def _save_queue(self, guild_id, items):
+        old, first_seq = self.saved.get(guild_id, ([], 0))
+        if old == items:
+            # Tracks compare by identity, so this is a cheap pointer comparison
+            return
+
+        # Played songs leave from the front: find where the current queue starts in the saved one
+        if not items or not old:
+            start = len(old)
+        else:
+            try:
+                start = old.index(items[0])
+            except ValueError:
+                start = None
+        kept = len(old) - start if start is not None else 0
+
+        if start is not None and old[start:] == items[:kept]:
+            if start:
+                await self.db.execute('DELETE FROM queue_items WHERE guild_id = ? AND seq < ?', (guild_id, first_seq + start))
+            next_seq = first_seq + len(old)
+            new_items = items[kept:]
+            first_seq += start
+        else:
+            # Reordered or removed from the middle: rewrite this guild's rows
+            self.stats['rewrites'] += 1
+            await self.db.execute('DELETE FROM queue_items WHERE guild_id = ?', (guild_id,))
+            next_seq = first_seq = 0
+            new_items = items
+
+        if new_items:
+            await self.db.executemany('INSERT INTO queue_items VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                      [(guild_id, next_seq + i, *_track_row(track)) for i, track in enumerate(new_items)])
+            self.stats['rows_written'] += len(new_items)
+        self.saved[guild_id] = (items, first_seq)
@@ -0,0 +1,104 @@
+import aiosqlite
+import os
+import re
+import time
+
+from utils.extraction_cache import canonical_key
+
+# Memo settings
+SEARCH_MEMO_MAX_AGE_DAYS = float(os.getenv('SEARCH_MEMO_MAX_AGE_DAYS', 30)) # Re-search matches older than this
+
+def normalize_query(query):
+    """Lowercases and strips punctuation so 'Artist - Song' and 'artist  song' share a memo row."""
+    query = query.casefold()
+    if query.startswith('ytsearch:'):
+        query = query[len('ytsearch:'):]
+    query = re.sub(r'[^\w\s]', ' ', query)
+    return ' '.join(query.split())
+
+class SearchMemo:
+    """
+    Persistent search query -> YouTube video mapping.
+    Lookups by Spotify track ID or ISRC win over the free-text query.
+    """
+    def __init__(self, db_path, max_age_days=SEARCH_MEMO_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.max_age = max_age_days * 86400
+        self.db = None
+        self.stats = {'hits': 0, 'misses': 0}
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute('PRAGMA journal_mode=WAL')
+        await self.db.execute('''
+            CREATE TABLE IF NOT EXISTS search_memo (
+                query TEXT PRIMARY KEY,
+                spotify_id TEXT,
+                isrc TEXT,
+                video_key TEXT,
+                url TEXT,
+                title TEXT,
+                updated_at INTEGER
+            )
+        ''')
+        await self.db.execute('CREATE INDEX IF NOT EXISTS idx_search_memo_spotify ON search_memo (spotify_id)')
+        await self.db.execute('CREATE INDEX IF NOT EXISTS idx_search_memo_isrc ON search_memo (isrc)')
+        await self.db.execute('CREATE INDEX IF NOT EXISTS idx_search_memo_video ON search_memo (video_key)')
+        await self.db.commit()
+
+    async def close(self):
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    async def lookup(self, query, spotify_id=None, isrc=None):
+        """Returns {'url', 'title'} for a remembered search, or None if unknown or stale."""
+        min_updated = int(time.time() - self.max_age)
+        row = None
+        if spotify_id:
+            cursor = await self.db.execute(
+                'SELECT url, title FROM search_memo WHERE spotify_id = ? AND updated_at >= ? LIMIT 1', (spotify_id, min_updated))
+            row = await cursor.fetchone()
+        if not row and isrc:
+            cursor = await self.db.execute(
+                'SELECT url, title FROM search_memo WHERE isrc = ? AND updated_at >= ? LIMIT 1', (isrc, min_updated))
+            row = await cursor.fetchone()
+        if not row:
+            cursor = await self.db.execute(
+                'SELECT url, title FROM search_memo WHERE query = ? AND updated_at >= ?', (normalize_query(query), min_updated))
+            row = await cursor.fetchone()
+
+        if not row:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return {'url': row[0], 'title': row[1]}
+
+    async def store(self, query, url, title, spotify_id=None, isrc=None):
+        await self.db.execute('''
+            INSERT INTO search_memo (query, spotify_id, isrc, video_key, url, title, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(query) DO UPDATE SET
+                spotify_id = COALESCE(excluded.spotify_id, spotify_id),
+                isrc = COALESCE(excluded.isrc, isrc),
+                video_key = excluded.video_key,
+                url = excluded.url,
+                title = excluded.title,
+                updated_at = excluded.updated_at
+        ''', (normalize_query(query), spotify_id, isrc, canonical_key(url), url, title, int(time.time())))
+        await self.db.commit()
+
+    async def forget(self, query=None, spotify_id=None, url=None):
+        """Deletes wrong matches by query, Spotify track ID or matched YouTube URL. Returns rows removed."""
+        removed = 0
+        if query:
+            cursor = await self.db.execute('DELETE FROM search_memo WHERE query = ?', (normalize_query(query),))
+            removed += cursor.rowcount
+        if spotify_id:
+            cursor = await self.db.execute('DELETE FROM search_memo WHERE spotify_id = ?', (spotify_id,))
+            removed += cursor.rowcount
+        if url:
+            cursor = await self.db.execute('DELETE FROM search_memo WHERE video_key = ?', (canonical_key(url),))
+            removed += cursor.rowcount
+        await self.db.commit()
+        return removed
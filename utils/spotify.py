@@ -0,0 +1,145 @@
+import aiohttp
+import asyncio
+import os
+import re
+import time
+
+# Endpoints are configurable so the client can be pointed at a local fake server
+SPOTIFY_API_BASE = os.getenv('SPOTIFY_API_BASE', 'https://api.spotify.com/v1')
+SPOTIFY_ACCOUNTS_BASE = os.getenv('SPOTIFY_ACCOUNTS_BASE', 'https://accounts.spotify.com')
+SPOTIFY_CACHE_TTL = int(os.getenv('SPOTIFY_CACHE_TTL', 600)) # Seconds API responses are reused
+SPOTIFY_PAGE_CONCURRENCY = 8 # Parallel page requests per playlist/album
+SPOTIFY_MAX_RETRIES = 3
+CACHE_MAX_ENTRIES = 512
+
+PLAYLIST_PAGE_SIZE = 100
+ALBUM_PAGE_SIZE = 50
+TRACKS_BATCH_SIZE = 50
+PLAYLIST_FIELDS = 'total,items(track(id,name,artists(name),external_ids))'
+
+SPOTIFY_URL_RE = re.compile(r'(track|playlist|album)[/:]([A-Za-z0-9]+)')
+
+class SpotifyError(Exception):
+    pass
+
+def parse_spotify_url(url):
+    """Returns (kind, id) for open.spotify.com links and spotify: URIs, or (None, None)."""
+    match = SPOTIFY_URL_RE.search(url)
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+class SpotifyClient:
+    """
+    Minimal asyncio Spotify Web API client (client credentials flow).
+    Replaces spotipy so no request ever blocks the event loop.
+    """
+    def __init__(self, client_id, client_secret, api_base=SPOTIFY_API_BASE, accounts_base=SPOTIFY_ACCOUNTS_BASE, cache_ttl=SPOTIFY_CACHE_TTL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_base = api_base.rstrip('/')
+        self.accounts_base = accounts_base.rstrip('/')
+        self.cache_ttl = cache_ttl
+        self.session = None
+        self.token = None
+        self.token_expires = 0
+        self.token_lock = asyncio.Lock()
+        self.cache = {} # {(path, params): (expires_at, data)}
+        self.page_slots = asyncio.Semaphore(SPOTIFY_PAGE_CONCURRENCY)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        return self.session
+
+    async def _get_token(self):
+        if self.token and time.time() < self.token_expires:
+            return self.token
+        async with self.token_lock:
+            if self.token and time.time() < self.token_expires:
+                return self.token
+            auth = aiohttp.BasicAuth(self.client_id, self.client_secret)
+            async with self._session().post(f"{self.accounts_base}/api/token", data={'grant_type': 'client_credentials'}, auth=auth) as resp:
+                if resp.status != 200:
+                    raise SpotifyError(f"Spotify auth failed ({resp.status})")
+                data = await resp.json()
+            self.token = data['access_token']
+            # Refresh a minute early so in-flight requests never carry an expired token
+            self.token_expires = time.time() + data.get('expires_in', 3600) - 60
+            return self.token
+
+    async def _get(self, path, **params):
+        key = (path, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        for attempt in range(SPOTIFY_MAX_RETRIES):
+            token = await self._get_token()
+            headers = {'Authorization': f"Bearer {token}"}
+            async with self.page_slots:
+                async with self._session().get(f"{self.api_base}{path}", params=params, headers=headers) as resp:
+                    if resp.status == 429:
+                        retry_after = float(resp.headers.get('Retry-After', 1))
+                    elif resp.status == 401:
+                        self.token = None
+                        continue
+                    elif resp.status != 200:
+                        raise SpotifyError(f"Spotify request {path} failed ({resp.status})")
+                    else:
+                        data = await resp.json()
+                        self._store(key, data)
+                        return data
+            await asyncio.sleep(retry_after)
+        raise SpotifyError(f"Spotify request {path} failed after {SPOTIFY_MAX_RETRIES} attempts")
+
+    def _store(self, key, data):
+        now = time.time()
+        if len(self.cache) >= CACHE_MAX_ENTRIES:
+            self.cache = {k: v for k, v in self.cache.items() if v[0] > now}
+            if len(self.cache) >= CACHE_MAX_ENTRIES:
+                self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = (now + self.cache_ttl, data)
+
+    async def track(self, track_id):
+        return await self._get(f"/tracks/{track_id}")
+
+    async def tracks(self, track_ids):
+        """Fetches full tracks through the batch endpoint, 50 IDs per request, in parallel."""
+        batches = [track_ids[i:i + TRACKS_BATCH_SIZE] for i in range(0, len(track_ids), TRACKS_BATCH_SIZE)]
+        pages = await asyncio.gather(*(self._get('/tracks', ids=','.join(batch)) for batch in batches))
+        return [track for page in pages for track in page['tracks'] if track]
+
+    async def playlist_tracks(self, playlist_id):
+        """Fetches the first page to learn the total, then the remaining pages concurrently."""
+        path = f"/playlists/{playlist_id}/tracks"
+        first = await self._get(path, limit=PLAYLIST_PAGE_SIZE, offset=0, fields=PLAYLIST_FIELDS)
+        offsets = range(PLAYLIST_PAGE_SIZE, first.get('total', 0), PLAYLIST_PAGE_SIZE)
+        pages = await asyncio.gather(*(self._get(path, limit=PLAYLIST_PAGE_SIZE, offset=offset, fields=PLAYLIST_FIELDS) for offset in offsets))
+        items = first['items'] + [item for page in pages for item in page['items']]
+        return [item['track'] for item in items if item.get('track') and item['track'].get('id')]
+
+    async def album_tracks(self, album_id):
+        """Album pages only hold simplified tracks, so they are hydrated through the batch endpoint (for ISRCs)."""
+        path = f"/albums/{album_id}/tracks"
+        first = await self._get(path, limit=ALBUM_PAGE_SIZE, offset=0)
+        offsets = range(ALBUM_PAGE_SIZE, first.get('total', 0), ALBUM_PAGE_SIZE)
+        pages = await asyncio.gather(*(self._get(path, limit=ALBUM_PAGE_SIZE, offset=offset) for offset in offsets))
+        simplified = first['items'] + [item for page in pages for item in page['items']]
+        return await self.tracks([track['id'] for track in simplified if track.get('id')])
+
+    async def resolve(self, url):
+        """Returns the list of track objects behind a Spotify track/playlist/album link."""
+        kind, item_id = parse_spotify_url(url)
+        if kind == 'track':
+            return [await self.track(item_id)]
+        if kind == 'playlist':
+            return await self.playlist_tracks(item_id)
+        if kind == 'album':
+            return await self.album_tracks(item_id)
+        raise SpotifyError("Unsupported Spotify link")
@@ -0,0 +1,170 @@
+import aiosqlite
+import asyncio
+
+# Connection tuning
+CACHE_SIZE_KB = 16384 # Page cache per connection
+MMAP_SIZE = 64 * 1024 * 1024 # Bytes of the database file read through mmap
+STATEMENT_CACHE_SIZE = 64 # Compiled statements kept per connection
+BUSY_TIMEOUT_MS = 5000
+
+# Legacy migration settings
+MIGRATION_BATCH = 5000 # Rows copied per transaction
+MIGRATION_PAUSE = 0.05 # Seconds between batches, so commands and flushes get the writer
+
+# Stats are per guild: a user active in two servers has a row in each.
+# WITHOUT ROWID stores rows clustered by (guild_id, user_id).
+GUILD_STATS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS guild_stats (
+        guild_id INTEGER,
+        user_id INTEGER,
+        total_time INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        xp INTEGER DEFAULT 0,
+        songs_played INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID
+'''
+# Covers the leaderboard: rows come out of the index already in rank order, no table lookups or sort
+RANK_INDEX = 'CREATE INDEX IF NOT EXISTS idx_guild_stats_rank ON guild_stats (guild_id, xp DESC, user_id, level)'
+
+class StatsDB:
+    """
+    Long-lived SQLite connections for leveling.db.
+    Writes go through one connection and reads through another; with WAL a read
+    never waits behind a running write. Statements are compiled once per connection
+    and reused from sqlite3's statement cache, so callers should keep their SQL as
+    constant strings.
+    """
+    def __init__(self, db_path, xp_per_level=600):
+        self.db_path = db_path
+        self.xp_per_level = xp_per_level
+        self.writer = None
+        self.reader = None
+        self.write_lock = asyncio.Lock() # One transaction at a time on the shared writer
+        self.migrated_upto = None # Last legacy user_id copied while a migration is pending, else None
+        self.stop_event = asyncio.Event() # Set to end migrate_legacy after its current batch
+        self.stats = {'migrated': 0}
+
+    async def _connect(self, query_only=False):
+        db = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        await db.execute('PRAGMA journal_mode=WAL')
+        await db.execute('PRAGMA synchronous=NORMAL') # Safe with WAL; only the last commits can be lost on power loss
+        await db.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        await db.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        await db.execute('PRAGMA temp_store=MEMORY')
+        await db.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        if query_only:
+            await db.execute('PRAGMA query_only=ON')
+        return db
+
+    async def open(self):
+        self.writer = await self._connect()
+
+    async def open_reader(self):
+        """Opens the read connection; call after the schema exists."""
+        self.reader = await self._connect(query_only=True)
+
+    async def close(self):
+        for db in (self.reader, self.writer):
+            if db:
+                await db.close()
+        self.reader = self.writer = None
+
+    async def write_many(self, sql, rows):
+        """Runs one statement for every row in a single transaction."""
+        async with self.write_lock:
+            try:
+                await self.writer.executemany(sql, rows)
+                await self.writer.commit()
+            except BaseException:
+                # Don't leave a half-written transaction for the next commit on this connection
+                await self.writer.rollback()
+                raise
+
+    async def create_schema(self):
+        await self.writer.execute(GUILD_STATS_SCHEMA)
+        await self.writer.execute(RANK_INDEX)
+        await self.writer.execute('CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, last_key INTEGER)')
+        cursor = await self.writer.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'")
+        if await cursor.fetchone():
+            # The old one-row-per-user table is still there: copy it over in the background
+            try:
+                await self.writer.execute('ALTER TABLE user_stats ADD COLUMN songs_played INTEGER DEFAULT 0')
+            except Exception:
+                pass
+            cursor = await self.writer.execute("SELECT last_key FROM migrations WHERE name = 'user_stats'")
+            row = await cursor.fetchone()
+            self.migrated_upto = row[0] if row else -1
+        await self.writer.commit()
+
+    async def migrate_legacy(self, batch=MIGRATION_BATCH, pause=MIGRATION_PAUSE):
+        """
+        Copies user_stats into guild_stats in user_id order, one short transaction per batch.
+        Progress is committed with each batch, so a restart resumes where it stopped.
+        New XP written meanwhile is kept: copied rows are added to, not replace, existing ones.
+        Use stop_migration to end it; a batch and its progress row commit together or not at all.
+        """
+        while self.migrated_upto is not None and not self.stop_event.is_set():
+            async with self.write_lock:
+                try:
+                    await self._migrate_batch(batch)
+                except BaseException:
+                    # Cancelled or failed mid-batch: drop the partial copy, or a later commit on
+                    # this connection would save it without its progress row and it would be copied twice
+                    await self.writer.rollback()
+                    raise
+            if self.migrated_upto is not None:
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), pause)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop_migration(self):
+        self.stop_event.set()
+
+    async def _migrate_batch(self, batch):
+        cursor = await self.writer.execute(
+            'SELECT max(user_id), count(*) FROM (SELECT user_id FROM user_stats WHERE user_id > ? ORDER BY user_id LIMIT ?)',
+            (self.migrated_upto, batch))
+        last, count = await cursor.fetchone()
+        if not count:
+            await self.writer.execute("DELETE FROM migrations WHERE name = 'user_stats'")
+            await self.writer.execute('DROP TABLE user_stats')
+            await self.writer.commit()
+            self.migrated_upto = None
+            print(f"Leveling migration finished: {self.stats['migrated']} rows moved to guild_stats")
+            return
+        # Same backfill the old schema ran at startup: XP for voice time from before XP existed
+        await self.writer.execute(f'''
+            INSERT INTO guild_stats (guild_id, user_id, total_time, xp, level, songs_played)
+            SELECT guild_id, user_id, total_time, new_xp, 1 + new_xp / {self.xp_per_level}, songs_played
+            FROM (
+                SELECT guild_id, user_id, total_time, songs_played,
+                       CASE WHEN xp = 0 AND total_time > 0 THEN (total_time / 60) * 10 ELSE xp END AS new_xp
+                FROM user_stats WHERE user_id > ? AND user_id <= ? AND guild_id IS NOT NULL
+            ) WHERE true
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                total_time = total_time + excluded.total_time,
+                xp = xp + excluded.xp,
+                level = 1 + (xp + excluded.xp) / {self.xp_per_level},
+                songs_played = songs_played + excluded.songs_played
+        ''', (self.migrated_upto, last))
+        await self.writer.execute('INSERT OR REPLACE INTO migrations VALUES (?, ?)', ('user_stats', last))
+        await self.writer.commit()
+        self.migrated_upto = last
+        self.stats['migrated'] += count
+
+    async def fetchone(self, sql, params=()):
+        cursor = await self.reader.execute(sql, params)
+        try:
+            return await cursor.fetchone()
+        finally:
+            # Closing ends the read transaction so WAL checkpoints are not held back
+            await cursor.close()
+
+    async def fetchall(self, sql, params=()):
+        cursor = await self.reader.execute(sql, params)
+        try:
+            return await cursor.fetchall()
+        finally:
+            await cursor.close()
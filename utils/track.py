@@ -0,0 +1,55 @@
+import re
+import sys
+
+YOUTUBE_URL_RE = re.compile(r'^https?://(?:www\.|music\.)?youtube\.com/watch\?v=([A-Za-z0-9_-]{11})$')
+
+_requesters = {} # Shared int objects for requester IDs, one per user
+
+def intern_requester(requester_id):
+    if requester_id is None:
+        return None
+    return _requesters.setdefault(requester_id, requester_id)
+
+class Track:
+    """
+    One queued song. Slotted and read-only to keep huge queues small:
+    YouTube URLs are stored as the bare video ID and repeated strings are interned.
+    Use with_info() to get a copy with resolved metadata.
+    """
+    __slots__ = ('ref', 'source', 'title', 'requester_id', 'duration', 'thumbnail')
+
+    def __init__(self, url, title, requester_id=None, duration=None, thumbnail=None):
+        match = YOUTUBE_URL_RE.match(url or '')
+        if match:
+            ref, source = match.group(1), 'youtube'
+        else:
+            ref, source = url, None
+        set_ = object.__setattr__
+        set_(self, 'ref', ref)
+        set_(self, 'source', source)
+        set_(self, 'title', title or 'Unknown Title')
+        set_(self, 'requester_id', intern_requester(requester_id))
+        set_(self, 'duration', duration)
+        set_(self, 'thumbnail', thumbnail)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Track is read-only, use with_info()")
+
+    def __repr__(self):
+        return f"Track({self.url!r}, {self.title!r})"
+
+    @property
+    def url(self):
+        if self.source == 'youtube':
+            return f"https://www.youtube.com/watch?v={self.ref}"
+        return self.ref
+
+    @classmethod
+    def from_info(cls, info, requester_id=None, fallback_title=None):
+        """Builds a Track from a (flat or full) yt-dlp info dict, keeping nothing else of it."""
+        url = info.get('original_url') or info.get('webpage_url') or info.get('url')
+        return cls(url, sys.intern(info.get('title') or fallback_title or 'Unknown Title'), requester_id, info.get('duration'), info.get('thumbnail'))
+
+    def with_info(self, title=None, duration=None, thumbnail=None):
+        """Returns a copy with resolved metadata filled in."""
+        return Track(self.url, title or self.title, self.requester_id, duration if duration is not None else self.duration, thumbnail or self.thumbnail)
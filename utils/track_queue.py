@@ -0,0 +1,166 @@
+import random
+import sys
+from collections import deque
+from itertools import chain, islice
+
+class TrackQueue:
+    """
+    Per-guild song queue built for very long playlists.
+    Entries live in small deques ("blocks") with a Fenwick tree over the block
+    lengths, so popping the head is O(1) and indexing, insert, remove and move
+    are O(log n) plus a bounded shift inside one block.
+    """
+    LOAD = 256 # Target block size; blocks are split at twice this
+
+    def __init__(self, items=()):
+        self._blocks = []
+        self._tree = [0] # Fenwick tree over len(block), 1-indexed
+        self._len = 0
+        self.extend(items)
+
+    # Fenwick tree helpers
+    def _rebuild(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, block_index, delta):
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index):
+        """Returns (block index, offset in block) of a 0-based position."""
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= index:
+                pos = nxt
+                index -= self._tree[nxt]
+            step >>= 1
+        return pos, index
+
+    def _normalize(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        return index
+
+    def _drop_if_empty(self, block_index):
+        if not self._blocks[block_index]:
+            del self._blocks[block_index]
+            self._rebuild()
+
+    def _split_if_full(self, block_index):
+        block = self._blocks[block_index]
+        if len(block) > 2 * self.LOAD:
+            tail = deque(islice(block, self.LOAD, None))
+            for _ in range(len(tail)):
+                block.pop()
+            self._blocks.insert(block_index + 1, tail)
+            self._rebuild()
+
+    # Sequence API
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __sizeof__(self):
+        # Container overhead only (blocks and index), not the entries themselves
+        return object.__sizeof__(self) + sys.getsizeof(self._blocks) + sys.getsizeof(self._tree) + sum(sys.getsizeof(block) for block in self._blocks)
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            return list(self.islice(start, stop))
+        block_index, offset = self._locate(self._normalize(index))
+        return self._blocks[block_index][offset]
+
+    def islice(self, start, stop=None):
+        """Iterates entries [start:stop] without copying the queue."""
+        stop = self._len if stop is None else min(stop, self._len)
+        if start >= stop:
+            return iter(())
+        block_index, offset = self._locate(start)
+        first = islice(self._blocks[block_index], offset, None)
+        rest = chain.from_iterable(self._blocks[block_index + 1:])
+        return islice(chain(first, rest), stop - start)
+
+    def append(self, item):
+        if not self._blocks or len(self._blocks[-1]) >= self.LOAD:
+            self._blocks.append(deque())
+            self._rebuild()
+        self._blocks[-1].append(item)
+        self._add(len(self._blocks) - 1, 1)
+        self._len += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from empty queue")
+        item = self._blocks[0].popleft()
+        self._add(0, -1)
+        self._len -= 1
+        self._drop_if_empty(0)
+        return item
+
+    def pop(self, index=-1):
+        index = self._normalize(index)
+        if index == 0:
+            return self.popleft()
+        block_index, offset = self._locate(index)
+        block = self._blocks[block_index]
+        item = block[offset]
+        del block[offset]
+        self._add(block_index, -1)
+        self._len -= 1
+        self._drop_if_empty(block_index)
+        return item
+
+    def insert(self, index, item):
+        if index < 0:
+            index = max(0, index + self._len)
+        if index >= self._len:
+            return self.append(item)
+        block_index, offset = self._locate(index)
+        self._blocks[block_index].insert(offset, item)
+        self._add(block_index, 1)
+        self._len += 1
+        self._split_if_full(block_index)
+
+    def appendleft(self, item):
+        self.insert(0, item)
+
+    def move(self, src, dst):
+        """Moves the entry at src so it ends up at position dst."""
+        item = self.pop(src)
+        self.insert(dst, item)
+        return item
+
+    def shuffle(self):
+        items = list(self)
+        random.shuffle(items)
+        self.clear()
+        self.extend(items)
+
+    def clear(self):
+        self._blocks = []
+        self._tree = [0]
+        self._len = 0